@@ -0,0 +1,309 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS monthly_aggregates (
+    user_id  TEXT    NOT NULL,
+    month    INTEGER NOT NULL,
+    category TEXT    NOT NULL,
+    amount   REAL    NOT NULL,
+    count    INTEGER NOT NULL,
+    PRIMARY KEY (user_id, month, category)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id       TEXT PRIMARY KEY,
+    user_id  TEXT    NOT NULL,
+    month    INTEGER NOT NULL,
+    category TEXT    NOT NULL,
+    amount   REAL    NOT NULL
+) WITHOUT ROWID;
+
+-- Phiên bản dữ liệu của mỗi user, tăng sau mỗi lần ingest làm thay đổi tổng của user đó
+CREATE TABLE IF NOT EXISTS user_versions (
+    user_id  TEXT PRIMARY KEY,
+    version  INTEGER NOT NULL
+) WITHOUT ROWID;
+
+-- Người dùng được tính trước kết quả (precompute.py) và tham số đánh giá của họ
+CREATE TABLE IF NOT EXISTS precompute_users (
+    user_id  TEXT PRIMARY KEY,
+    budget   REAL NOT NULL,
+    income   REAL NOT NULL
+) WITHOUT ROWID;
+
+-- Trạng thái OnlineForecaster theo nhóm của mỗi user (JSON), hợp lệ khi version còn khớp
+CREATE TABLE IF NOT EXISTS online_states (
+    user_id  TEXT PRIMARY KEY,
+    version  INTEGER NOT NULL,
+    state    TEXT    NOT NULL
+) WITHOUT ROWID;
+
+-- Kết quả tính trước (JSON), hợp lệ khi month và version còn khớp
+CREATE TABLE IF NOT EXISTS precomputed (
+    user_id     TEXT PRIMARY KEY,
+    month       INTEGER NOT NULL,
+    version     INTEGER NOT NULL,
+    computed_at REAL    NOT NULL,
+    payload     TEXT    NOT NULL
+) WITHOUT ROWID;
+"""
+
+UPSERT_AGGREGATE = """
+INSERT INTO monthly_aggregates (user_id, month, category, amount, count)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (user_id, month, category) DO UPDATE SET
+    amount = amount + excluded.amount,
+    count = count + excluded.count
+"""
+
+
+def month_key(date):
+    """
+    Chỉ số tháng nguyên (year * 12 + month - 1) của một ngày.
+    """
+    ts = pd.Timestamp(date)
+    if ts is pd.NaT:
+        raise ValueError(f"invalid date {date!r}")
+    return ts.year * 12 + ts.month - 1
+
+
+def month_dates(months):
+    """
+    Ngày 1 của mỗi tháng từ mảng chỉ số tháng nguyên.
+    """
+    months = np.asarray(months, dtype=np.int64)
+    return pd.to_datetime(pd.DataFrame({"year": months // 12, "month": months % 12 + 1, "day": 1}))
+
+
+# -----------------------------------
+# 💾 Kho tổng chi tiêu theo tháng (SQLite)
+# -----------------------------------
+class AggregateStore:
+    """
+    Lưu tổng chi tiêu theo (user, tháng, category); nhóm (Necessary/Other/Unnecessary)
+    được suy ra từ category khi đọc. Bảng transactions chỉ giữ chỉ mục id -> (tháng, category,
+    amount) để áp dụng update/delete dưới dạng delta.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def apply(self, events, journal=None):
+        """
+        Áp dụng danh sách sự kiện giao dịch:
+        {"op": "insert" | "update" | "delete", "id", "userId", "date", "amount", "category"}.
+        insert/update đều là upsert theo id; delete chỉ cần "id".
+        Trả về số sự kiện theo loại và danh sách user bị thay đổi ("users").
+        journal: list nhận (user, month, category, amount) cho mỗi giao dịch mới thêm và
+        (user, None, None, None) khi giao dịch cũ bị sửa / xoá (xem online.py).
+        """
+        counts = {"inserted": 0, "updated": 0, "deleted": 0, "ignored": 0}
+        users = set()
+        with self._lock, self._conn:
+            cur = self._conn.cursor()
+            for event in events:
+                if not isinstance(event, dict):
+                    raise ValueError("each event must be an object")
+                op = event.get("op", "insert")
+                if op not in ("insert", "update", "delete"):
+                    raise ValueError(f"Unknown op '{op}'")
+                txn_id = str(event["id"])
+                old = cur.execute(
+                    "SELECT user_id, month, category, amount FROM transactions WHERE id = ?", (txn_id,)
+                ).fetchone()
+
+                if old is not None:
+                    users.add(old[0])
+                    if journal is not None:
+                        journal.append((old[0], None, None, None))
+                    cur.execute(UPSERT_AGGREGATE, (old[0], old[1], old[2], -old[3], -1))
+                    cur.execute("DELETE FROM transactions WHERE id = ?", (txn_id,))
+
+                if op == "delete":
+                    counts["deleted" if old is not None else "ignored"] += 1
+                    continue
+
+                try:
+                    amount = float(event["amount"])
+                except (TypeError, ValueError):
+                    amount = np.nan
+                if not np.isfinite(amount):
+                    raise ValueError(f"'amount' of event '{txn_id}' must be a finite number")
+                row = (
+                    str(event["userId"]),
+                    month_key(event["date"]),
+                    event.get("category") or "Other",
+                    amount,
+                )
+                users.add(row[0])
+                if journal is not None and old is None:
+                    journal.append(row)
+                cur.execute(UPSERT_AGGREGATE, row + (1,))
+                cur.execute(
+                    "INSERT INTO transactions (id, user_id, month, category, amount) VALUES (?, ?, ?, ?, ?)",
+                    (txn_id,) + row,
+                )
+                counts["updated" if old is not None else "inserted"] += 1
+
+            cur.execute("DELETE FROM monthly_aggregates WHERE count <= 0")
+            cur.executemany(
+                "INSERT INTO user_versions (user_id, version) VALUES (?, 1) "
+                "ON CONFLICT (user_id) DO UPDATE SET version = version + 1",
+                [(user,) for user in users],
+            )
+        counts["users"] = sorted(users)
+        return counts
+
+    def monthly_frame(self, user_ids=None):
+        """
+        Bảng tổng theo tháng: cột userId, month (int), category, amount.
+        """
+        query = "SELECT user_id, month, category, amount FROM monthly_aggregates"
+        params = ()
+        if user_ids is not None:
+            user_ids = [str(u) for u in user_ids]
+            query += f" WHERE user_id IN ({','.join('?' * len(user_ids))})"
+            params = tuple(user_ids)
+        query += " ORDER BY user_id, month"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return pd.DataFrame(rows, columns=["userId", "month", "category", "amount"])
+
+    def records_frame(self, user_ids=None):
+        """
+        Bảng dạng records (date, amount, category, userId) với mỗi dòng là tổng một
+        category trong một tháng, date = ngày 1 của tháng. Dùng trực tiếp được cho
+        evaluate_expenses / predict_next_month_by_group.
+        """
+        monthly = self.monthly_frame(user_ids)
+        return pd.DataFrame({
+            "date": month_dates(monthly["month"]),
+            "amount": monthly["amount"],
+            "category": monthly["category"],
+            "userId": monthly["userId"],
+        })
+
+    def users(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT user_id FROM monthly_aggregates")]
+
+    def version(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM user_versions WHERE user_id = ?", (str(user_id),)
+            ).fetchone()
+        return row[0] if row else 0
+
+    # -----------------------------------
+    # 🔁 Trạng thái dự đoán online (xem online.py)
+    # -----------------------------------
+    def save_online_states(self, user_id, version, states):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO online_states (user_id, version, state) VALUES (?, ?, ?)",
+                (str(user_id), int(version), json.dumps(states)),
+            )
+
+    def load_online_states(self, user_id):
+        """
+        (version, trạng thái) đã lưu của user, hoặc None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, state FROM online_states WHERE user_id = ?", (str(user_id),)
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    # -----------------------------------
+    # ⏱️ Kết quả tính trước (xem precompute.py)
+    # -----------------------------------
+    def register_precompute(self, user_id, budget, income, replace=True):
+        """
+        Đánh dấu user cần tính trước; replace=False giữ tham số đã đăng ký trước đó.
+        """
+        verb = "REPLACE" if replace else "IGNORE"
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR {verb} INTO precompute_users (user_id, budget, income) VALUES (?, ?, ?)",
+                (str(user_id), float(budget), float(income)),
+            )
+
+    def precompute_users(self):
+        """
+        {user_id: (budget, income)} của các user đang được tính trước.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, budget, income FROM precompute_users").fetchall()
+        return {user: (budget, income) for user, budget, income in rows}
+
+    def stale_precompute_users(self, month):
+        """
+        Các user đã đăng ký nhưng chưa có kết quả hợp lệ cho tháng này.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT u.user_id FROM precompute_users u "
+                "LEFT JOIN precomputed p ON p.user_id = u.user_id "
+                "LEFT JOIN user_versions v ON v.user_id = u.user_id "
+                "WHERE p.user_id IS NULL OR p.month != ? OR p.version != COALESCE(v.version, 0)",
+                (int(month),),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def save_precomputed(self, user_id, month, version, payload):
+        """
+        payload: tài liệu JSON đã mã hoá (bytes / str).
+        """
+        if isinstance(payload, bytes):
+            payload = payload.decode()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO precomputed (user_id, month, version, computed_at, payload) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (str(user_id), int(month), int(version), time.time(), payload),
+            )
+
+    def load_precomputed(self, user_id, month):
+        """
+        Kết quả tính trước của user nếu vẫn còn hợp lệ (cùng tháng và cùng phiên bản dữ liệu).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT p.payload FROM precomputed p LEFT JOIN user_versions v ON v.user_id = p.user_id "
+                "WHERE p.user_id = ? AND p.month = ? AND p.version = COALESCE(v.version, 0)",
+                (str(user_id), int(month)),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Kho dùng chung của tiến trình, mở khi dùng lần đầu (AGGREGATE_STORE_PATH).
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AggregateStore(os.environ.get("AGGREGATE_STORE_PATH", "expense_aggregates.db"))
+    return _store
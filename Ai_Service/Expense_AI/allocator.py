@@ -0,0 +1,88 @@
+import numpy as np
+
+# Trọng số ưu tiên giữ lại chi tiêu và tỉ lệ tối thiểu được giữ của từng nhóm
+# (nhóm không xác định được xử lý như Unnecessary)
+GROUP_WEIGHTS = {"Necessary": 3, "Other": 2}
+GROUP_MIN_RATIOS = {"Necessary": 0.75, "Other": 0.6}
+DEFAULT_WEIGHT = 1
+DEFAULT_MIN_RATIO = 0.4
+
+SOLVERS = ("greedy", "linprog")
+
+
+def group_weights_and_bounds(groups):
+    """
+    Mảng trọng số và tỉ lệ tối thiểu cho mảng tên nhóm (bất kỳ shape nào).
+    """
+    groups = np.asarray(groups, dtype=object)
+    weights = np.full(groups.shape, DEFAULT_WEIGHT, dtype=float)
+    lower = np.full(groups.shape, DEFAULT_MIN_RATIO, dtype=float)
+    for group, weight in GROUP_WEIGHTS.items():
+        weights[groups == group] = weight
+    for group, ratio in GROUP_MIN_RATIOS.items():
+        lower[groups == group] = ratio
+    return weights, lower
+
+
+# -----------------------------------
+# ⚡ Greedy (continuous knapsack, dạng đóng)
+# -----------------------------------
+def greedy_ratios(preds, weights, lower, budgets):
+    """
+    Giải đồng thời cho nhiều người dùng bài toán
+        max sum(w_i * r_i)  s.t.  sum(p_i * r_i) <= budget,  lower_i <= r_i <= 1
+    (cùng bài toán LP mà linprog giải trong suggest_expense_reduction).
+
+    preds / weights / lower: mảng (n_users, n_groups); ô đệm là NaN trong preds.
+    budgets: mảng (n_users,).
+    Trả về (ratios, success); success=False khi ngay cả mức tối thiểu đã vượt ngân sách.
+
+    Đây là knapsack liên tục một ràng buộc: bắt đầu từ r = lower rồi cấp phần ngân sách
+    còn lại theo thứ tự w/p giảm dần -> nghiệm tối ưu, không cần solver.
+    """
+    preds = np.atleast_2d(np.asarray(preds, dtype=float))
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    lower = np.atleast_2d(np.asarray(lower, dtype=float))
+    budgets = np.asarray(budgets, dtype=float).reshape(-1)
+
+    valid = ~np.isnan(preds)
+    p = np.where(valid, preds, 0.0)
+    # p <= 0: tăng r không tốn ngân sách (hoặc còn giải phóng) -> luôn chọn r = 1
+    start = np.where(p > 0, lower, 1.0)
+    remaining = budgets - (p * start).sum(axis=1)
+
+    capacity = np.where(p > 0, p * (1.0 - start), 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        priority = np.where(p > 0, weights / p, -np.inf)
+    order = np.argsort(-priority, axis=1, kind="stable")
+
+    cap_sorted = np.take_along_axis(capacity, order, axis=1)
+    used_before = np.cumsum(cap_sorted, axis=1) - cap_sorted
+    fill_sorted = np.clip(np.maximum(remaining, 0.0)[:, None] - used_before, 0.0, cap_sorted)
+    fill = np.empty_like(fill_sorted)
+    np.put_along_axis(fill, order, fill_sorted, axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = start + np.where(p > 0, fill / p, 0.0)
+    ratios = np.where(valid, ratios, np.nan)
+
+    tolerance = 1e-9 * np.maximum(np.abs(budgets), 1.0)
+    success = remaining >= -tolerance
+    return ratios, success
+
+
+# -----------------------------------
+# 🐢 scipy linprog (tham chiếu, chỉ import khi được chọn)
+# -----------------------------------
+def linprog_ratios(preds, weights, lower, budget):
+    """
+    Giải bằng scipy.optimize.linprog (HiGHS) cho một người dùng. Trả về (ratios, success).
+    """
+    from scipy.optimize import linprog
+
+    c = [-w for w in weights]
+    A = [preds]
+    b = [budget]
+    bounds = [(lo, 1.0) for lo in lower]
+    res = linprog(c, A_ub=A, b_ub=b, bounds=bounds, method="highs")
+    return (np.asarray(res.x) if res.success else None), res.success
@@ -0,0 +1,304 @@
+"""
+Phát hiện chi tiêu bất thường bằng thống kê bền vững (median / MAD), so với chính lịch sử
+của từng user:
+- Giao dịch: modified z-score của số tiền so với các giao dịch cùng (user, category).
+- Tháng của category: tổng tháng so với median / MAD trượt của `window` tháng trước đó.
+Cả hai đều tính vector hoá cho mọi user cùng lúc (không lặp Python theo user / category).
+Chỉ đánh dấu phía chi NHIỀU bất thường.
+"""
+import numpy as np
+import pandas as pd
+
+from categories import default_registry
+from metrics import ROWS, stage
+from payloads import frame_records
+
+DEFAULT_THRESHOLD = 3.5  # ngưỡng modified z-score thường dùng (Iglewicz & Hoaglin)
+DEFAULT_WINDOW = 6
+MIN_HISTORY = 3
+
+# Đổi MAD / độ lệch tuyệt đối trung bình ra độ lệch chuẩn của phân phối chuẩn
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+# Độ lệch tối thiểu theo tỉ lệ median: chuỗi gần như cố định (tiền nhà) vẫn có thang đo,
+# và vài đồng chênh lệch không thành bất thường
+MIN_RELATIVE_SCALE = 0.1
+
+TRANSACTION_COLUMNS = ["row", "date", "category", "group", "amount", "median", "score"]
+MONTH_COLUMNS = ["month", "category", "group", "amount", "median", "score"]
+
+
+def _robust_scale(mad, mean_ad, median):
+    """
+    Độ lệch chuẩn ước lượng từ MAD; MAD = 0 (hơn nửa số giá trị bằng nhau) -> dùng độ lệch
+    tuyệt đối trung bình. Không nhỏ hơn MIN_RELATIVE_SCALE * |median|.
+    """
+    scale = np.where(mad > 0, MAD_SCALE * mad, MEAN_AD_SCALE * mean_ad)
+    return np.maximum(scale, MIN_RELATIVE_SCALE * np.abs(median))
+
+
+def _z_scores(values, center, scale, enough):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (values - center) / scale
+    return np.where(enough & (scale > 0), z, 0.0)
+
+
+def _factorize_categories(categories):
+    """
+    factorize cột category; category thiếu được gộp vào "Other".
+    """
+    codes, values = pd.factorize(categories)
+    values = np.asarray(values, dtype=object)
+    if (codes < 0).any():
+        other = np.flatnonzero(values == "Other")
+        if len(other) == 0:
+            values = np.append(values, "Other")
+            other = [len(values) - 1]
+        codes = np.where(codes < 0, other[0], codes)
+    return codes, values
+
+
+def _month_index(dates):
+    return dates.astype("datetime64[M]").astype(np.int64) + 1970 * 12
+
+
+def _parse_dates(values):
+    """
+    (mảng datetime64 bỏ tz như expenses_model._parse_dates, chỉ số tháng year * 12 + month - 1).
+    Cột chuỗi chỉ có vài trăm ngày khác nhau cho hàng triệu giao dịch: parse và tính tháng cho
+    các giá trị khác nhau rồi lấy lại theo mã factorize.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        dates = pd.Series(values)
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        dates = dates.to_numpy()
+        return dates, _month_index(dates)
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(np.asarray(uniques, dtype=object)))
+    if parsed.dt.tz is not None:
+        parsed = parsed.dt.tz_localize(None)
+    # Mã -1 (ngày thiếu) trỏ vào phần tử NaT thêm ở cuối
+    parsed = np.append(parsed.to_numpy(), np.datetime64("NaT", "ns"))
+    return parsed[codes], _month_index(parsed)[codes]
+
+
+def _prepare(df, user_col):
+    """
+    Parse ngày, bỏ dòng thiếu số tiền / ngày / user, mã hoá chuỗi (user, category) và chỉ số tháng.
+    Mỗi cột được factorize riêng (trực tiếp trên Series) rồi ghép mã nguyên, nhanh hơn nhiều
+    so với factorize cặp giá trị object.
+    """
+    with stage("parse_dates"):
+        dates, months = _parse_dates(df['date'])
+    amounts = pd.to_numeric(df['amount'], errors="coerce").to_numpy(dtype=float)
+    valid = ~(np.isnan(amounts) | np.isnat(dates))
+    if user_col:
+        user_codes, user_values = pd.factorize(df[user_col])
+        # userId thiếu (mã -1) không thuộc về user nào
+        valid &= user_codes >= 0
+    else:
+        user_codes, user_values = np.zeros(len(valid), dtype=np.int64), np.array([None])
+    rows = np.arange(len(valid)) if valid.all() else np.flatnonzero(valid)
+    category_codes, category_values = _factorize_categories(df['category'])
+    n_categories = len(category_values)
+    pairs = user_codes[rows].astype(np.int64) * n_categories + category_codes[rows]
+    codes, uniques = pd.factorize(pairs)
+    dates = dates[rows]
+    return {
+        "rows": rows,
+        "dates": dates,
+        "amounts": amounts[rows],
+        "codes": codes,
+        "user_values": np.asarray(user_values, dtype=object),
+        "users": np.asarray(user_values, dtype=object)[uniques // n_categories],
+        "categories": category_values[uniques % n_categories],
+        "months": months[rows],
+    }
+
+
+# -----------------------------------
+# 💸 Giao dịch bất thường
+# -----------------------------------
+def _transaction_scores(prepared, min_history):
+    """
+    (median, z) cho mỗi giao dịch so với mọi giao dịch cùng (user, category).
+    """
+    codes, amounts = prepared["codes"], prepared["amounts"]
+    counts = np.bincount(codes)
+    # Median / MAD theo chuỗi tính một lần cho mỗi chuỗi rồi lấy lại theo codes. Mã chuỗi đã là
+    # 0..n-1 nên groupby theo Categorical dùng thẳng mã, không phải hash lại 1 triệu giá trị.
+    series = pd.Categorical.from_codes(codes, categories=pd.RangeIndex(len(counts)))
+    median = pd.Series(amounts).groupby(series, observed=False).median().to_numpy()
+    deviation = np.abs(amounts - median[codes])
+    mad = pd.Series(deviation).groupby(series, observed=False).median().to_numpy()
+    mean_ad = np.bincount(codes, weights=deviation) / counts
+    scale = _robust_scale(mad, mean_ad, median)
+    enough = counts >= min_history
+    return median[codes], _z_scores(amounts, median[codes], scale[codes], enough[codes])
+
+
+# -----------------------------------
+# 📅 Tháng bất thường theo category
+# -----------------------------------
+def _median_positions(counts, width):
+    """
+    Vị trí (trong mảng trải phẳng) của hai phần tử giữa mỗi dòng, counts = số giá trị hợp lệ mỗi dòng.
+    """
+    base = np.arange(len(counts)) * width
+    return base + (counts - 1) // 2, base + counts // 2
+
+
+def _sorted_median(sorted_values, positions):
+    """
+    Median theo dòng của mảng đã sort (giá trị không hợp lệ ở cuối), positions từ _median_positions.
+    """
+    flat = sorted_values.ravel()
+    return (flat[positions[0]] + flat[positions[1]]) / 2
+
+
+def _month_scores(prepared, window, min_history):
+    """
+    Tổng chi của mỗi (chuỗi, tháng) so với median / MAD của `window` tháng trước đó.
+    Tháng không có giao dịch sau lần chi đầu tiên của chuỗi được tính là 0.
+    Chỉ tính cho các tháng có chi tiêu và đủ min_history tháng lịch sử;
+    trả về (chuỗi, vị trí tháng, tổng, median, z) của các ô đó và tháng đầu tiên.
+    """
+    codes, months = prepared["codes"], prepared["months"]
+    n_series = len(prepared["categories"])
+    first = months.min()
+    n_months = months.max() - first + 1
+    flat = codes * n_months + (months - first)
+    size = n_series * n_months
+
+    # Ô (chuỗi, tháng) có chi tiêu, theo thứ tự chuỗi rồi tháng; mỗi chuỗi có ít nhất một ô
+    totals = np.bincount(flat, weights=prepared["amounts"], minlength=size)
+    cells = np.flatnonzero(np.bincount(flat, minlength=size))
+    series, month_pos = np.divmod(cells, n_months)
+    runs = np.flatnonzero(np.r_[True, series[1:] != series[:-1]])
+    history = month_pos - np.repeat(month_pos[runs], np.diff(np.r_[runs, len(cells)]))
+    keep = np.flatnonzero(history >= min_history)
+    cells, series, month_pos = cells[keep], series[keep], month_pos[keep]
+    counts = np.minimum(history[keep], window)
+
+    # Cửa sổ của tháng t là các tháng t - window .. t - 1; chỉ `counts` tháng cuối nằm sau tháng
+    # đầu tiên của chuỗi, phần trước đó là NaN (sort về cuối)
+    windows = np.take(totals, cells[:, None] + np.arange(-window, 0), mode="clip")
+    windows[np.arange(window) < (window - counts)[:, None]] = np.nan
+    windows.sort(axis=1)
+    positions = _median_positions(counts, window)
+    median = _sorted_median(windows, positions)
+    # Độ lệch tính tại chỗ trên mảng cửa sổ (NaN vẫn ở cuối mỗi dòng sau khi sort)
+    deviation = np.abs(np.subtract(windows, median[:, None], out=windows), out=windows)
+    deviation.sort(axis=1)
+    mad = _sorted_median(deviation, positions)
+    mean_ad = np.where(np.arange(window) < counts[:, None], deviation, 0.0).sum(axis=1) / counts
+    values = totals[cells]
+    # Category thường không chi (median = 0) không có mức nền để so
+    z = _z_scores(values, median, _robust_scale(mad, mean_ad, median), median > 0)
+    return series, month_pos, values, median, z, first
+
+
+def _month_labels(first, n_months):
+    """
+    Nhãn "YYYY-MM" cho các tháng first .. first + n_months - 1.
+    """
+    months = np.arange(first, first + n_months)
+    return np.array([f"{m // 12}-{m % 12 + 1:02d}" for m in months], dtype=object)
+
+
+# -----------------------------------
+# 🚨 API
+# -----------------------------------
+def _frame(prepared, user_col, series, columns):
+    """
+    Bảng kết quả: thêm category / nhóm (và user) của mỗi chuỗi, sắp theo score giảm dần.
+    """
+    categories = prepared["categories"][series]
+    frame = pd.DataFrame(columns)
+    frame.insert(frame.columns.get_loc("amount"), "category", categories)
+    frame.insert(frame.columns.get_loc("amount"), "group", _classify(prepared["registry"], categories))
+    if user_col:
+        frame.insert(0, user_col, prepared["users"][series])
+    return frame.sort_values("score", ascending=False, kind="stable", ignore_index=True)
+
+
+def _classify(registry, categories):
+    return registry.classify_series(pd.Series(categories)).astype(str).to_numpy()
+
+
+def _detect(df, user_col, threshold, window, min_history, registry):
+    """
+    (bảng giao dịch bất thường, bảng tháng-category bất thường, dữ liệu đã chuẩn bị);
+    hai bảng sắp theo score giảm dần.
+    """
+    empty = pd.DataFrame(columns=TRANSACTION_COLUMNS), pd.DataFrame(columns=MONTH_COLUMNS)
+    if df.empty:
+        return empty + ({"user_values": []},)
+    prepared = _prepare(df, user_col)
+    prepared["registry"] = registry or default_registry
+    if len(prepared["amounts"]) == 0:
+        return empty + (prepared,)
+
+    with stage("anomaly_transactions"):
+        median, z = _transaction_scores(prepared, min_history)
+        flagged = np.flatnonzero(z > threshold)
+        transactions = _frame(prepared, user_col, prepared["codes"][flagged], {
+            "row": prepared["rows"][flagged],
+            "date": np.datetime_as_string(prepared["dates"][flagged], unit="D"),
+            "amount": prepared["amounts"][flagged].round(2),
+            "median": median[flagged].round(2),
+            "score": z[flagged].round(2),
+        })
+
+    with stage("anomaly_months"):
+        series, month_pos, values, median, z, first = _month_scores(prepared, window, min_history)
+        flagged = np.flatnonzero(z > threshold)
+        months = _frame(prepared, user_col, series[flagged], {
+            "month": _month_labels(first, month_pos.max(initial=0) + 1)[month_pos[flagged]],
+            "amount": values[flagged].round(2),
+            "median": median[flagged].round(2),
+            "score": z[flagged].round(2),
+        })
+    return transactions, months, prepared
+
+
+def detect_anomalies(df, threshold=DEFAULT_THRESHOLD, window=DEFAULT_WINDOW, min_history=MIN_HISTORY,
+                     registry=None):
+    """
+    Giao dịch và tháng-category bất thường của MỘT user.
+    transactions: row (vị trí dòng trong df), date, category, group, amount, median, score.
+    months: category, group, month, amount, median (của `window` tháng trước), score.
+    """
+    ROWS.inc(len(df), "detect_anomalies")
+    try:
+        transactions, months, _ = _detect(df, None, threshold, window, min_history, registry)
+        return {
+            "transactions": frame_records(transactions),
+            "months": frame_records(months),
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def detect_anomalies_batch(df, user_col="userId", threshold=DEFAULT_THRESHOLD, window=DEFAULT_WINDOW,
+                           min_history=MIN_HISTORY, registry=None):
+    """
+    Như detect_anomalies cho nhiều user trong một lần tính; trả về {user: {...}}.
+    Mỗi user chỉ được so với lịch sử của chính họ.
+    """
+    ROWS.inc(len(df), "detect_anomalies_batch")
+    try:
+        transactions, months, prepared = _detect(df, user_col, threshold, window, min_history, registry)
+        results = {user: {"transactions": [], "months": []} for user in prepared["user_values"]}
+        for key, frame in (("transactions", transactions), ("months", months)):
+            # Gom theo user (sort ổn định giữ thứ tự score giảm dần), mỗi user lấy một đoạn liên tiếp
+            user_codes, users = pd.factorize(frame[user_col].to_numpy(dtype=object))
+            order = np.argsort(user_codes, kind="stable")
+            records = frame_records(frame.drop(columns=[user_col]).take(order))
+            bounds = np.r_[0, np.cumsum(np.bincount(user_codes, minlength=len(users)))].tolist()
+            for user, start, end in zip(users, bounds[:-1], bounds[1:]):
+                results[user][key] = records[start:end]
+        return results
+    except Exception as e:
+        return {"error": str(e)}
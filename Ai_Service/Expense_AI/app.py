@@ -1,73 +1,251 @@
-from flask import Flask, request, jsonify
+import atexit
+import time
+
+from flask import Flask, Response, g, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import pandas as pd
-from expenses_model import evaluate_expenses, predict_next_month_by_group, suggest_expense_reduction
-import numpy as np
+from model_cache import forecast_cache
+from aggregate_store import get_store
+from handlers import (
+    TRANSACTION_LEVEL_ROUTES,
+    handle_anomalies,
+    handle_anomalies_batch,
+    handle_evaluate,
+    handle_evaluate_range,
+    handle_insights,
+    handle_nowcast,
+    handle_nowcast_update,
+    handle_predict,
+    handle_predict_batch,
+    handle_suggest,
+    handle_suggest_batch,
+)
+from payloads import (
+    InvalidPayload,
+    UnsupportedFormat,
+    decode_body,
+    decode_ndjson,
+    dumps_json,
+    encode_response,
+    is_ndjson,
+)
+from precompute import DEFAULT_BUDGET, DEFAULT_INCOME, get_precomputer, start_precomputer, stop_precomputer
+from prewarm import start_prewarm
+import metrics
+import online
+import profiling
+import singleflight
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    jsonify dùng cùng bộ mã hoá với các endpoint tính toán (payloads.dumps_json).
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps_json(obj).decode()
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
+single_flight = singleflight.SingleFlight()
+
+# sklearn / scipy được import nền, không chặn lúc khởi động
+start_prewarm()
+
+# Scheduler tính trước chạy cùng service (tính lại lúc khởi động / sang tháng mới), dừng khi thoát
+start_precomputer()
+atexit.register(stop_precomputer)
+
+def read_payload():
+    """
+    Body request đã giải mã theo Content-Type (JSON / MessagePack / Arrow IPC stream / NDJSON).
+    NDJSON được đọc dần từ stream, không nạp cả body vào bộ nhớ.
+    """
+    if is_ndjson(request.content_type):
+        with metrics.stage("decode"):
+            return decode_ndjson(request.stream, request.args, allows_folded())
+    return decode_payload(request.get_data(cache=False))
+
+def allows_folded():
+    """
+    NDJSON (gộp thành tổng theo tháng) chỉ dùng được cho endpoint không cần từng giao dịch.
+    """
+    return request.url_rule is None or request.url_rule.rule not in TRANSACTION_LEVEL_ROUTES
+
+def decode_payload(body):
+    with metrics.stage("decode"):
+        return decode_body(body, request.content_type, request.args, allows_folded())
+
+def respond(result, status=200):
+    """
+    Trả kết quả theo định dạng client yêu cầu qua header Accept.
+    """
+    g.result = result
+    with metrics.stage("encode"):
+        body, mimetype = encode_response(result, request.headers.get('Accept'))
+    return Response(body, status=status, mimetype=mimetype)
+
+def run_handler(handler, coalesce=True):
+    """
+    Giải mã body và chạy handler; gộp các request trùng đang chạy (xem singleflight.py)
+    và profile request khi admin yêu cầu (xem profiling.py).
+    coalesce=False cho handler có tác dụng phụ (request trùng vẫn phải chạy riêng).
+    """
+    mode = profiling.requested_mode(request.headers, request.args)
+    if mode is None and coalesce and singleflight.enabled() and not is_ndjson(request.content_type):
+        # Request trùng payload đang chạy -> chờ và dùng chung kết quả
+        body = request.get_data(cache=False)
+        key = singleflight.request_key(request.path, request.content_type, request.args, body)
+        return respond(*single_flight.do(key, lambda: handler(decode_payload(body)), request.url_rule.rule))
 
-def convert_types(obj):
-    if isinstance(obj, np.generic):
-        return obj.item()
-    elif isinstance(obj, dict):
-        return {k: convert_types(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_types(i) for i in obj]
-    else:
-        return obj
+    data = read_payload()
+    if mode is None:
+        return respond(*handler(data))
+
+    (result, status), profile_id = profiling.profile_call(handler, (data,), mode, request.path)
+    response = respond(result, status)
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    if endpoint != '/metrics' and 'request_start' in g:
+        metrics.observe_request(
+            endpoint, response.status_code, time.perf_counter() - g.request_start, g.get('result')
+        )
+    return response
+
+@app.errorhandler(UnsupportedFormat)
+def unsupported_format(e):
+    return jsonify({"error": str(e)}), 415
+
+@app.errorhandler(profiling.ProfilingDenied)
+def profiling_denied(e):
+    return jsonify({"error": str(e)}), 403
+
+@app.errorhandler(InvalidPayload)
+def invalid_payload(e):
+    return jsonify({"error": str(e)}), 400
     
 @app.route('/')
 def home():
     return jsonify({"message": "Expense Prediction API is running 🚀"})
 
-@app.route('/evaluate', methods=['POST'])
-def evaluate():
-    data = request.get_json()
-    if not data or 'records' not in data:
-        return jsonify({"error": "Missing 'records' field"}), 400
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(forecast_cache.stats())
 
-    df = pd.DataFrame(data['records'])
-    
-    budget = data.get('budget', 2000)
-    income = data.get('income', 3000)
-    prev_expenses = data.get('prev_expenses', 1800)
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
-    # Cập nhật lời gọi hàm, bỏ 'month_year'
-    result = evaluate_expenses(df, budget, income, prev_expenses)
-    result = convert_types(result)
+@app.route('/profiles/<profile_id>')
+def download_profile(profile_id):
+    path = profiling.profile_path(profile_id, request.headers.get('X-Profile-Token'))
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, as_attachment=True, download_name=profile_id)
+
+@app.route('/ingest', methods=['POST'])
+def ingest():
+    data = read_payload()
+    if not data or 'events' not in data:
+        return jsonify({"error": "Missing 'events' field"}), 400
+
+    store = get_store()
+    journal = []
+    try:
+        result = store.apply(data['events'], journal)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid event: {e}"}), 400
+    online.apply_journal(journal, store)
+
+    # User vừa thay đổi được tính trước lại (giữ budget / income đã đăng ký nếu có)
+    precomputer = get_precomputer()
+    if precomputer is not None and result["users"]:
+        for user in result["users"]:
+            store.register_precompute(user, DEFAULT_BUDGET, DEFAULT_INCOME, replace=False)
+        precomputer.enqueue(result["users"], "ingest")
     return jsonify(result)
 
+@app.route('/precompute', methods=['GET', 'POST'])
+def precompute():
+    """
+    POST {"users": [{"userId", "budget", "income"}, ...]}: đăng ký và xếp hàng tính trước.
+    GET: trạng thái hàng đợi.
+    """
+    precomputer = get_precomputer()
+    if precomputer is None:
+        return jsonify({"error": "Precompute is disabled"}), 503
+    if request.method == 'GET':
+        return jsonify(precomputer.stats())
+
+    data = read_payload()
+    if not data or not isinstance(data.get('users'), list):
+        return jsonify({"error": "Missing 'users' field"}), 400
+
+    store = get_store()
+    users = []
+    try:
+        for entry in data['users']:
+            user = str(entry['userId'])
+            store.register_precompute(user, entry.get('budget', DEFAULT_BUDGET), entry.get('income', DEFAULT_INCOME))
+            users.append(user)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid user entry: {e}"}), 400
+    precomputer.enqueue(users, "register")
+    return jsonify({"queued": users, **precomputer.stats()})
+
+@app.route('/evaluate', methods=['POST'])
+def evaluate():
+    return run_handler(handle_evaluate)
+
+@app.route('/evaluate/range', methods=['POST'])
+def evaluate_range():
+    return run_handler(handle_evaluate_range)
+
 @app.route('/predict', methods=['POST'])
 def predict():
-    data = request.get_json()
-    if not data or 'records' not in data:
-        return jsonify({"error": "Missing 'records' field"}), 400
+    return run_handler(handle_predict)
 
-    df = pd.DataFrame(data['records'])
-    result = convert_types(predict_next_month_by_group(df))
-    return jsonify(result.to_dict(orient="records"))
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    return run_handler(handle_predict_batch)
 
 @app.route('/suggest', methods=['POST'])
 def suggest():
-    data = request.get_json()
-    if not data or 'predictions' not in data or 'income' not in data:
-        return jsonify({"error": "Missing 'predictions' or 'income' field"}), 400
+    return run_handler(handle_suggest)
 
-    try:
-        # 1. Lấy dữ liệu dự đoán (từ /predict)
-        predictions_list = data['predictions']
-        predicted_df = pd.DataFrame(predictions_list)
-        
-        # 2. Lấy thu nhập
-        income = data.get('income')
-
-        # 3. Gọi hàm đề xuất
-        result = convert_types(suggest_expense_reduction(predicted_df, income))
-        return jsonify(result)
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+@app.route('/suggest/batch', methods=['POST'])
+def suggest_batch():
+    return run_handler(handle_suggest_batch)
+
+@app.route('/insights', methods=['POST'])
+def insights():
+    # Đánh giá + dự đoán + đề xuất trên cùng một lần parse records
+    return run_handler(handle_insights)
+
+@app.route('/anomalies', methods=['POST'])
+def anomalies():
+    return run_handler(handle_anomalies)
+
+@app.route('/anomalies/batch', methods=['POST'])
+def anomalies_batch():
+    return run_handler(handle_anomalies_batch)
+
+# Trạng thái nowcast nằm trong tiến trình chính (asgi.py chuyển hai route này sang Flask)
+@app.route('/nowcast', methods=['POST'])
+def nowcast():
+    return run_handler(handle_nowcast)
+
+@app.route('/nowcast/update', methods=['POST'])
+def nowcast_update():
+    return run_handler(handle_nowcast_update, coalesce=False)
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=True, port=5000)
@@ -0,0 +1,271 @@
+"""
+Chế độ chạy production (ASGI) cho AI service.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+- Đọc và giải mã body trên event loop.
+- Các endpoint tính toán (handlers.COMPUTE_HANDLERS) chạy trong process pool có giới hạn,
+  nên một /predict chậm không chặn /evaluate khác.
+- Các request giống hệt nhau đến cùng lúc chỉ được tính một lần (singleflight.py).
+- Quá ASGI_MAX_PENDING request đang chờ -> 503; quá ASGI_REQUEST_TIMEOUT giây -> 504.
+- Các route còn lại (/ingest, /cache/stats, /metrics, ...) chuyển sang Flask app trong thread pool.
+- Scheduler tính trước (precompute.py) chạy và dừng theo lifespan của server.
+
+Cấu hình: ASGI_POOL_WORKERS (mặc định số CPU), ASGI_MAX_PENDING (mặc định 4 * workers),
+ASGI_REQUEST_TIMEOUT (mặc định 30), ASGI_POOL_START_METHOD (mặc định forkserver).
+PREWARM=0 để tắt việc import trước sklearn/scipy trong các worker.
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl
+
+from handlers import COMPUTE_HANDLERS, TRANSACTION_LEVEL_ROUTES
+from payloads import InvalidPayload, UnsupportedFormat, decode_body, encode_response
+from precompute import start_precomputer, stop_precomputer
+from prewarm import warm_imports
+import metrics
+import profiling
+import singleflight
+
+
+def _worker_init():
+    warnings.filterwarnings("ignore")
+
+
+def _run_handler(path, data, profile_mode=None):
+    """
+    Chạy trong tiến trình worker; số liệu metrics của worker được gửi kèm về tiến trình chính.
+    profile_mode: profile handler ngay trong worker (xem profiling.py), trả về kèm profile id.
+    """
+    profile_id = None
+    if profile_mode is None:
+        result, status = COMPUTE_HANDLERS[path](data)
+    else:
+        (result, status), profile_id = profiling.profile_call(COMPUTE_HANDLERS[path], (data,), profile_mode, path)
+    return result, status, metrics.REGISTRY.drain(), profile_id
+
+
+class AsyncService:
+    def __init__(self, workers=None, max_pending=None, timeout=None):
+        self.workers = workers or int(os.environ.get("ASGI_POOL_WORKERS", os.cpu_count() or 1))
+        self.max_pending = max_pending or int(os.environ.get("ASGI_MAX_PENDING", 4 * self.workers))
+        self.timeout = timeout or float(os.environ.get("ASGI_REQUEST_TIMEOUT", 30))
+        self.pending = 0
+        self._flight = singleflight.AsyncSingleFlight()
+        self._pool = None
+        self._flask_app = None
+
+    # -----------------------------------
+    # ⚙️ Vòng đời process pool
+    # -----------------------------------
+    def start(self):
+        if self._pool is None:
+            context = multiprocessing.get_context(os.environ.get("ASGI_POOL_START_METHOD", "forkserver"))
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context, initializer=_worker_init
+            )
+            # Khởi động sẵn worker và import sklearn/scipy trong đó, không chờ kết quả
+            if os.environ.get("PREWARM", "1") != "0":
+                for _ in range(self.workers):
+                    self._pool.submit(warm_imports)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def flask_app(self):
+        if self._flask_app is None:
+            from app import app as flask_app
+            self._flask_app = flask_app
+        return self._flask_app
+
+    # -----------------------------------
+    # 🌐 ASGI entrypoint
+    # -----------------------------------
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        body = await _read_body(receive)
+        path = scope["path"].rstrip("/") or "/"
+        headers = _headers(scope)
+
+        if path == "/" and scope["method"] == "GET":
+            # Health check trả lời ngay trên event loop
+            await _send_result(send, {"message": "Expense Prediction API is running 🚀"}, 200, headers.get("accept"))
+        elif path in COMPUTE_HANDLERS and scope["method"] == "POST":
+            await self._compute(path, scope, headers, body, send)
+        else:
+            status, response_headers, content = await asyncio.to_thread(
+                _call_wsgi, self.flask_app, scope, headers, body
+            )
+            await send({"type": "http.response.start", "status": status, "headers": response_headers})
+            await send({"type": "http.response.body", "body": content})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.start()
+                start_precomputer()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.shutdown()
+                await asyncio.to_thread(stop_precomputer)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _compute(self, path, scope, headers, body, send):
+        start = time.perf_counter()
+        result, status, extra_headers = await self._compute_result(path, scope, headers, body)
+        await _send_result(send, result, status, headers.get("accept"), extra_headers)
+        metrics.observe_request(path, status, time.perf_counter() - start, result)
+
+    async def _compute_result(self, path, scope, headers, body):
+        """
+        Trả về (kết quả, status, header bổ sung).
+        """
+        try:
+            profile_mode = profiling.requested_mode(headers, _query_args(scope))
+        except profiling.ProfilingDenied as e:
+            return {"error": str(e)}, 403, ()
+
+        if profile_mode is None and singleflight.enabled():
+            # Request trùng payload đang chạy -> chờ và dùng chung kết quả
+            key = singleflight.request_key(path, headers.get("content-type"), _query_args(scope), body)
+            return await self._flight.do(
+                key, lambda: self._run_compute(path, scope, headers, body, None), path
+            )
+        return await self._run_compute(path, scope, headers, body, profile_mode)
+
+    async def _run_compute(self, path, scope, headers, body, profile_mode):
+        try:
+            with metrics.stage("decode"):
+                data = decode_body(
+                    body, headers.get("content-type"), _query_args(scope), path not in TRANSACTION_LEVEL_ROUTES
+                )
+        except UnsupportedFormat as e:
+            return {"error": str(e)}, 415, ()
+        except InvalidPayload as e:
+            return {"error": str(e)}, 400, ()
+
+        if self.pending >= self.max_pending:
+            return {"error": "Server busy, retry later"}, 503, [(b"retry-after", b"1")]
+
+        self.start()
+        future = self._pool.submit(_run_handler, path, data, profile_mode)
+        self.pending += 1
+        # Chỉ giảm bộ đếm khi worker thực sự xong (kể cả sau timeout) để giới hạn đúng tải thật
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+
+        try:
+            result, status, worker_metrics, profile_id = await asyncio.wait_for(
+                asyncio.wrap_future(future), self.timeout
+            )
+        except asyncio.TimeoutError:
+            return {"error": f"Request timed out after {self.timeout:g}s"}, 504, ()
+        except Exception as e:
+            return {"error": str(e)}, 500, ()
+        metrics.REGISTRY.merge(worker_metrics)
+        if profile_id is not None:
+            return result, status, [(b"x-profile-id", profile_id.encode())]
+        return result, status, ()
+
+    def _release(self):
+        self.pending -= 1
+
+
+# -----------------------------------
+# 🔧 Tiện ích ASGI / WSGI
+# -----------------------------------
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _headers(scope):
+    return {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+
+
+def _query_args(scope):
+    return dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+
+
+async def _send(send, status, body, mimetype, extra_headers=()):
+    headers = [(b"content-type", mimetype.encode()), (b"content-length", str(len(body)).encode())]
+    headers.extend(extra_headers)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_result(send, result, status, accept, extra_headers=()):
+    with metrics.stage("encode"):
+        body, mimetype = encode_response(result, accept)
+    await _send(send, status, body, mimetype, extra_headers)
+
+
+def _call_wsgi(wsgi_app, scope, headers, body):
+    """
+    Gọi Flask (WSGI) cho một request ASGI, trả về (status, headers, body).
+    """
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for key, value in headers.items():
+        if key == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif key != "content-length":
+            environ["HTTP_" + key.upper().replace("-", "_")] = value
+
+    response = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in response_headers]
+
+    result = wsgi_app(environ, start_response)
+    try:
+        content = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], content
+
+
+app = AsyncService()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi:app", host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
@@ -0,0 +1,71 @@
+"""
+Đối chiếu greedy_ratios (dạng đóng, vector hoá) với scipy linprog trên các bài toán
+ngẫu nhiên và đo thời gian của cả hai.
+
+    python benchmarks/bench_allocator.py [--cases 2000] [--batch 10000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from allocator import greedy_ratios, group_weights_and_bounds, linprog_ratios  # noqa: E402
+
+GROUPS = np.array(["Necessary", "Other", "Unnecessary"], dtype=object)
+
+
+def random_problems(n, seed=0):
+    rng = np.random.default_rng(seed)
+    preds = rng.gamma(2.0, 500.0, (n, len(GROUPS)))
+    groups = np.broadcast_to(GROUPS, preds.shape)
+    weights, lower = group_weights_and_bounds(groups)
+    # Ngân sách nằm giữa mức tối thiểu và tổng dự đoán, một phần nhỏ không khả thi
+    floor = (preds * lower).sum(axis=1)
+    budgets = floor + rng.uniform(-0.1, 1.0, n) * (preds.sum(axis=1) - floor)
+    return preds, weights, lower, budgets
+
+
+def check(cases):
+    preds, weights, lower, budgets = random_problems(cases)
+    ratios, success = greedy_ratios(preds, weights, lower, budgets)
+    mismatches = 0
+    max_gap = 0.0
+    for i in range(cases):
+        ref, ok = linprog_ratios(preds[i], weights[i], lower[i], budgets[i])
+        if ok != success[i]:
+            mismatches += 1
+            continue
+        if ok:
+            gap = abs((weights[i] * ratios[i]).sum() - (weights[i] * ref).sum())
+            max_gap = max(max_gap, gap, np.abs(ratios[i] - ref).max())
+    print(f"{cases} cases: feasibility mismatches={mismatches}, max |objective/ratio diff|={max_gap:.2e}")
+    return mismatches == 0 and max_gap < 1e-6
+
+
+def bench(batch):
+    preds, weights, lower, budgets = random_problems(batch, seed=1)
+    n_linprog = min(batch, 500)
+    start = time.perf_counter()
+    for i in range(n_linprog):
+        linprog_ratios(preds[i], weights[i], lower[i], budgets[i])
+    per_linprog = (time.perf_counter() - start) / n_linprog
+
+    start = time.perf_counter()
+    greedy_ratios(preds, weights, lower, budgets)
+    greedy_total = time.perf_counter() - start
+    print(f"linprog: {per_linprog * 1e6:.0f} us/user | greedy batch of {batch}: "
+          f"{greedy_total * 1e3:.1f} ms ({greedy_total / batch * 1e6:.2f} us/user)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cases", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=10_000)
+    args = parser.parse_args()
+    ok = check(args.cases)
+    bench(args.batch)
+    sys.exit(0 if ok else 1)
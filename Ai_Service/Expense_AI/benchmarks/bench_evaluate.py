@@ -0,0 +1,48 @@
+"""
+Micro-benchmark evaluate_expenses: bản cũ (strftime + apply + nhiều lần lọc, module.py)
+so với bản mới (khoảng ngày/searchsorted + một phép groupby, expenses_model.py).
+
+    python benchmarks/bench_evaluate.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import module as legacy  # noqa: E402
+from benchmarks.synthetic import generate_history  # noqa: E402
+from expenses_model import evaluate_expenses  # noqa: E402
+
+
+def _best_of(fn, df, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        fn(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(sizes, repeat, months):
+    print(f"{'rows':>9} {'order':<8} {'legacy ms':>10} {'new ms':>8} {'speedup':>8}")
+    for n_rows in sizes:
+        history = generate_history(n_rows, months=months)
+        for order, df in (
+            ("random", history),
+            ("desc", history.sort_values("date", ascending=False, ignore_index=True)),
+        ):
+            old_s = _best_of(legacy.evaluate_expenses, df, repeat)
+            new_s = _best_of(evaluate_expenses, df, repeat)
+            print(f"{n_rows:>9} {order:<8} {old_s * 1e3:>10.1f} {new_s * 1e3:>8.1f} {old_s / new_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--months", type=int, default=60, help="độ dài lịch sử (tháng)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat, args.months)
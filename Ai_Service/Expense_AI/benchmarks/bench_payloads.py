@@ -0,0 +1,58 @@
+"""
+So sánh chi phí đọc body /evaluate, /predict theo định dạng: JSON records, JSON cột,
+MessagePack cột và Arrow IPC stream.
+
+    python benchmarks/bench_payloads.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import generate_history  # noqa: E402
+from payloads import ARROW_STREAM, JSON, MSGPACK, dataframe_to_arrow, decode_body, packb  # noqa: E402
+
+
+def _best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _encoders(df):
+    columns = df.drop(columns=["userId"])
+    arrow_df = columns.assign(date=pd.to_datetime(columns["date"]).dt.date)
+    return {
+        "json-records": (JSON, lambda: json.dumps({"records": columns.to_dict(orient="records")}).encode()),
+        "json-columnar": (JSON, lambda: json.dumps({"records": columns.to_dict(orient="list")}).encode()),
+        "msgpack-columnar": (MSGPACK, lambda: packb({"records": columns.to_dict(orient="list")})),
+        "arrow-stream": (ARROW_STREAM, lambda: dataframe_to_arrow(arrow_df)),
+    }
+
+
+def run(sizes, repeat):
+    print(f"{'rows':>9} {'format':<17} {'size MB':>9} {'encode ms':>10} {'decode ms':>10}")
+    for n_rows in sizes:
+        df = generate_history(n_rows)
+        rounds = 1 if n_rows >= 1_000_000 else repeat
+        for name, (content_type, encode) in _encoders(df).items():
+            body = encode()
+            encode_s = _best_of(encode, rounds)
+            decode_s = _best_of(lambda: pd.DataFrame(decode_body(body, content_type)["records"]), rounds)
+            print(f"{n_rows:>9} {name:<17} {len(body) / 1e6:>9.2f} {encode_s * 1e3:>10.1f} {decode_s * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
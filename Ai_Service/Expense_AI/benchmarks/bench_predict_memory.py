@@ -0,0 +1,62 @@
+"""
+Đo cấp phát bộ nhớ (tracemalloc) của predict_next_month_by_group: bản cũ (module.py)
+so với bản hiện tại (expenses_model.py), kèm kiểm tra hàm có sửa DataFrame đầu vào không.
+
+    python benchmarks/bench_predict_memory.py [--sizes 10000 100000 1000000] [--engine forest]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import module as legacy  # noqa: E402
+from benchmarks.synthetic import generate_history  # noqa: E402
+from expenses_model import predict_next_month_by_group  # noqa: E402
+from model_cache import forecast_cache  # noqa: E402
+
+
+def measure(fn, df):
+    """
+    Trả về (peak MB do tracemalloc ghi nhận, thời gian giây, df đầu vào có bị sửa không).
+    """
+    frame = df.copy()
+    before = frame.dtypes.to_dict(), list(frame.columns)
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(frame)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    mutated = (frame.dtypes.to_dict(), list(frame.columns)) != before
+    return peak / 1e6, elapsed, mutated
+
+
+def run(sizes, months, engine):
+    # Import lười (sklearn) và cache dự đoán không được tính vào phép đo
+    legacy.RandomForestRegressor
+    predict_next_month_by_group(generate_history(100, months=months), engine=engine)
+
+    print(f"{'rows':>9} {'input MB':>9} {'impl':<8} {'peak MB':>8} {'peak/input':>10} {'time s':>7} {'mutates':>8}")
+    for n_rows in sizes:
+        df = generate_history(n_rows, months=months).drop(columns=["userId"])
+        input_mb = df.memory_usage(deep=True).sum() / 1e6
+        for name, fn in (
+            ("legacy", legacy.predict_next_month_by_group),
+            ("current", lambda frame: predict_next_month_by_group(frame, engine=engine)),
+        ):
+            forecast_cache.clear()
+            peak_mb, elapsed, mutated = measure(fn, df)
+            print(f"{n_rows:>9} {input_mb:>9.1f} {name:<8} {peak_mb:>8.1f} {peak_mb / input_mb:>10.2f} "
+                  f"{elapsed:>7.2f} {'yes' if mutated else 'no':>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--months", type=int, default=24, help="độ dài lịch sử (tháng)")
+    parser.add_argument("--engine", default="forest")
+    args = parser.parse_args()
+    run(args.sizes, args.months, args.engine)
@@ -0,0 +1,331 @@
+"""
+Bộ benchmark tái lập cho evaluate / predict / suggest và các endpoint Flask (end to end).
+
+    python benchmarks/bench_suite.py [--rows 100 10000 1000000] [--users 1 100 10000]
+        [--targets evaluate predict anomalies ...] [--engine linear] [--repeat 5] [--max-seconds 30]
+        [--save results.json] [--baseline results.json | --no-baseline] [--tolerance 0.2] [--min-delta-ms 5]
+
+Mỗi case chạy trong một tiến trình con riêng: peak RSS không lẫn giữa các case và
+forecast cache bị tắt để mỗi lần chạy đều huấn luyện lại. In thông lượng, độ trễ
+p50/p95/p99 và peak RSS. Kết quả được so với baseline (mặc định benchmarks/baseline.json,
+đổi bằng --baseline, tắt bằng --no-baseline); exit 1 khi p50 của một case chậm hơn quá
+--tolerance và quá --min-delta-ms, hoặc khi một case không có trong baseline (engine là một
+phần của khoá case, nên baseline chỉ so được với đúng engine đã đo).
+
+baseline.json được tạo trên máy ghi trong "meta" bằng lệnh mặc định (engine linear):
+
+    python benchmarks/bench_suite.py --save benchmarks/baseline.json
+
+Số đo phụ thuộc máy: khi so trên máy khác, tạo lại baseline trước khi thay đổi code.
+
+Lưu ý: predict với engine forest cho 10k người dùng huấn luyện ~30k forest mỗi lần chạy;
+đo forest bằng --engine forest kèm --no-baseline hoặc một baseline riêng (--save / --baseline).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+TARGETS = ("evaluate", "predict", "suggest", "anomalies", "http_evaluate", "http_predict", "http_suggest")
+# Các target chỉ phụ thuộc số người dùng (mỗi người 3 nhóm dự đoán), không phụ thuộc số dòng
+PER_USER_TARGETS = ("suggest", "http_suggest")
+# evaluate không tách theo người dùng: chỉ đo với 1 người dùng
+SINGLE_USER_TARGETS = ("evaluate", "http_evaluate")
+GROUPS = ("Necessary", "Other", "Unnecessary")
+
+
+def case_key(case):
+    return f"{case['target']}/rows={case['rows']}/users={case['users']}/engine={case['engine']}"
+
+
+def plan_cases(targets, rows, users, engine):
+    cases = []
+    for target in targets:
+        for n_users in users:
+            if target in SINGLE_USER_TARGETS and n_users != 1:
+                continue
+            if target in PER_USER_TARGETS:
+                cases.append({"target": target, "rows": None, "users": n_users, "engine": None})
+                continue
+            for n_rows in rows:
+                if n_users <= n_rows:
+                    cases.append({
+                        "target": target, "rows": n_rows, "users": n_users,
+                        "engine": engine if "predict" in target else None,
+                    })
+    return cases
+
+
+# -----------------------------------
+# 🧪 Chạy một case (trong tiến trình con)
+# -----------------------------------
+def _synthetic_predictions(n_users, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    predictions = {}
+    incomes = {}
+    for i in range(n_users):
+        amounts = rng.gamma(2.0, 2_000_000.0, len(GROUPS))
+        predictions[f"user{i}"] = [
+            {"group": group, "predicted": round(float(amount), 2), "confidence": 0, "message": ""}
+            for group, amount in zip(GROUPS, amounts)
+        ]
+        # Khoảng một nửa người dùng vượt thu nhập -> phải giải bài toán phân bổ
+        incomes[f"user{i}"] = round(float(amounts.sum() * rng.uniform(0.6, 1.4)), 2)
+    return predictions, incomes
+
+
+def _build_call(case):
+    """
+    Trả về (hàm không tham số, số đơn vị xử lý mỗi lần gọi, tên đơn vị).
+    """
+    import pandas as pd
+
+    from anomalies import detect_anomalies, detect_anomalies_batch
+    from benchmarks.synthetic import generate_history
+    from expenses_model import (
+        evaluate_expenses,
+        predict_next_month_batch,
+        predict_next_month_by_group,
+        suggest_expense_reduction,
+        suggest_expense_reduction_batch,
+    )
+
+    target, n_users, engine = case["target"], case["users"], case["engine"]
+
+    if target in PER_USER_TARGETS:
+        predictions, incomes = _synthetic_predictions(n_users)
+        if target == "http_suggest":
+            if n_users == 1:
+                (user, user_predictions), = predictions.items()
+                return _http_call("/suggest", {"predictions": user_predictions, "income": incomes[user]}), n_users, "users"
+            return _http_call("/suggest/batch", {"predictions": predictions, "income": incomes}), n_users, "users"
+        if n_users == 1:
+            (user, user_predictions), = predictions.items()
+            return (
+                lambda: suggest_expense_reduction(pd.DataFrame(user_predictions), incomes[user]),
+                n_users, "users",
+            )
+        return lambda: suggest_expense_reduction_batch(predictions, incomes), n_users, "users"
+
+    history = generate_history(case["rows"], n_users=n_users)
+    n_rows = len(history)
+
+    if target == "evaluate":
+        df = history.drop(columns=["userId"])
+        return lambda: evaluate_expenses(df.copy()), n_rows, "rows"
+    if target == "predict":
+        if n_users == 1:
+            df = history.drop(columns=["userId"])
+            return lambda: predict_next_month_by_group(df.copy(), engine=engine), n_rows, "rows"
+        return lambda: predict_next_month_batch(history, engine=engine), n_rows, "rows"
+    if target == "anomalies":
+        if n_users == 1:
+            df = history.drop(columns=["userId"])
+            return lambda: detect_anomalies(df), n_rows, "rows"
+        return lambda: detect_anomalies_batch(history), n_rows, "rows"
+    if target == "http_evaluate":
+        records = history.drop(columns=["userId"]).to_dict(orient="records")
+        return _http_call("/evaluate", {"records": records}), n_rows, "rows"
+    if target == "http_predict":
+        if n_users == 1:
+            records = history.drop(columns=["userId"]).to_dict(orient="records")
+            return _http_call("/predict", {"records": records, "engine": engine}), n_rows, "rows"
+        records = history.to_dict(orient="records")
+        return _http_call("/predict/batch", {"records": records, "engine": engine}), n_rows, "rows"
+    raise ValueError(f"Unknown target '{target}'")
+
+
+def _http_call(path, payload):
+    """
+    Gọi endpoint qua Flask test client: gồm giải mã JSON, tính toán và mã hoá response.
+    Body được mã hoá một lần trước, không tính vào thời gian đo.
+    """
+    from app import app
+
+    client = app.test_client()
+    body = json.dumps(payload).encode()
+
+    def call():
+        response = client.post(path, data=body, content_type="application/json")
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response.get_data()
+    return call
+
+
+def _peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: KB, macOS: byte
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(case, repeat, max_seconds):
+    import numpy as np
+
+    from prewarm import warm_imports
+
+    warm_imports()
+    call, units, unit = _build_call(case)
+    rss_before = _peak_rss_mb()
+
+    timings = []
+    deadline = time.perf_counter() + max_seconds
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+        if time.perf_counter() > deadline:
+            break
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return dict(
+        case,
+        runs=len(timings),
+        p50_ms=round(p50 * 1e3, 3),
+        p95_ms=round(p95 * 1e3, 3),
+        p99_ms=round(p99 * 1e3, 3),
+        throughput=round(units / p50, 1),
+        unit=f"{unit}/s",
+        peak_rss_mb=round(_peak_rss_mb(), 1),
+        input_rss_mb=round(rss_before, 1),
+    )
+
+
+def spawn_case(case, repeat, max_seconds):
+    env = dict(os.environ, MODEL_CACHE_MAX_ENTRIES="0", PREWARM="0", PYTHONWARNINGS="ignore")
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case),
+         "--repeat", str(repeat), "--max-seconds", str(max_seconds)],
+        cwd=SERVICE_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return dict(case, error=(proc.stderr.strip().splitlines() or ["failed"])[-1])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# -----------------------------------
+# 📋 Báo cáo / so sánh baseline
+# -----------------------------------
+def print_result(result, baseline=None, compared=False):
+    label = case_key(result)
+    if "error" in result:
+        print(f"{label:<58} ERROR {result['error']}")
+        return
+    line = (f"{label:<58} {result['runs']:>3}x  p50 {result['p50_ms']:>10.2f} ms  "
+            f"p95 {result['p95_ms']:>10.2f}  p99 {result['p99_ms']:>10.2f}  "
+            f"{result['throughput']:>12,.0f} {result['unit']:<7}  peak RSS {result['peak_rss_mb']:>7.1f} MB")
+    if baseline is not None:
+        line += f"  vs baseline {result['p50_ms'] / baseline['p50_ms']:.2f}x"
+    elif compared:
+        line += "  (no baseline)"
+    print(line)
+
+
+def machine_meta():
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def load_baseline(path):
+    """
+    Kết quả baseline đã lưu; cảnh báo khi baseline được đo trên máy khác.
+    """
+    with open(path) as f:
+        saved = json.load(f)
+    meta, current = saved.get("meta", {}), machine_meta()
+    different = [key for key in ("python", "platform", "cpu_count") if meta.get(key) != current[key]]
+    if different:
+        print(f"WARNING baseline {path} was measured on a different machine ({', '.join(different)}); "
+              "regenerate it with --save before comparing")
+    print(f"baseline: {path} ({meta.get('created', 'unknown date')})")
+    return saved["results"]
+
+
+def compare(results, baseline_results, tolerance, min_delta_ms=0.0):
+    """
+    Các case có p50 chậm hơn baseline quá tolerance (tỉ lệ) VÀ quá min_delta_ms
+    (bỏ qua nhiễu của các case chỉ vài ms), cùng các case không có trong baseline (p50 cũ None).
+    """
+    baseline = {case_key(r): r for r in baseline_results if "error" not in r}
+    regressions = []
+    for result in results:
+        if "error" in result:
+            continue
+        ref = baseline.get(case_key(result))
+        if ref is None:
+            regressions.append((case_key(result), None, result["p50_ms"]))
+            continue
+        if (result["p50_ms"] > ref["p50_ms"] * (1 + tolerance)
+                and result["p50_ms"] - ref["p50_ms"] > min_delta_ms):
+            regressions.append((case_key(result), ref["p50_ms"], result["p50_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 10_000, 1_000_000])
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 100, 10_000])
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--engine", default="linear")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=30.0, help="ngân sách thời gian mỗi case (tối thiểu 1 lần chạy)")
+    parser.add_argument("--save", help="ghi kết quả ra file JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="file JSON kết quả trước đó để so sánh")
+    parser.add_argument("--no-baseline", action="store_true", help="không so với baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p50 chậm hơn baseline quá tỉ lệ này -> lỗi")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                        help="chỉ tính là chậm hơn khi p50 tăng quá số ms này")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        sys.path.insert(0, SERVICE_DIR)
+        print(json.dumps(run_case(json.loads(args.run_case), args.repeat, args.max_seconds)))
+        return 0
+
+    baseline_results = []
+    compared = not args.no_baseline and os.path.exists(args.baseline)
+    if compared:
+        baseline_results = load_baseline(args.baseline)
+    elif not args.no_baseline and args.baseline != DEFAULT_BASELINE:
+        parser.error(f"baseline file not found: {args.baseline}")
+    baseline_by_key = {case_key(r): r for r in baseline_results if "error" not in r}
+
+    results = []
+    for case in plan_cases(args.targets, args.rows, args.users, args.engine):
+        result = spawn_case(case, args.repeat, args.max_seconds)
+        ref = baseline_by_key.get(case_key(result))
+        print_result(result, ref if "error" not in result else None, compared)
+        results.append(result)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"meta": machine_meta(), "results": results}, f, indent=2)
+            f.write("\n")
+
+    failed = [r for r in results if "error" in r]
+    regressions = compare(results, baseline_results, args.tolerance, args.min_delta_ms) if compared else []
+    for key, old, new in regressions:
+        if old is None:
+            print(f"MISSING BASELINE {key}: p50 {new:.2f} ms (regenerate the baseline with --save)")
+        else:
+            print(f"REGRESSION {key}: p50 {old:.2f} ms -> {new:.2f} ms")
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
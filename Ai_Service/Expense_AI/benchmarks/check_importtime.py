@@ -0,0 +1,69 @@
+"""
+Kiểm tra ngân sách thời gian import (cold start) của AI service bằng `python -X importtime`.
+
+    python benchmarks/check_importtime.py [--module app] [--budget-ms 1500] [--top 10]
+
+Thất bại (exit 1) khi tổng thời gian import vượt ngân sách, hoặc khi một module nặng
+chỉ được phép import lười (sklearn, scipy) bị kéo vào lúc khởi động.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ("sklearn", "scipy")
+
+
+def import_times(module):
+    """
+    Chạy `python -X importtime -c "import <module>"` trong tiến trình mới (tắt prewarm),
+    trả về danh sách (cumulative_us, self_us, tên module) theo thứ tự import.
+    """
+    env = dict(os.environ, PREWARM="0")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-W", "ignore", "-c", f"import {module}"],
+        cwd=SERVICE_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # Tên module thụt lề theo độ sâu import, sau một dấu cách phân cách cột
+        rows.append((int(cumulative_us), int(self_us), name[1:].rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("IMPORT_BUDGET_MS", 1500)))
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    # Module gốc (không thụt lề) là cấp cao nhất; tổng của chúng là thời gian import thực
+    total_ms = sum(cumulative for cumulative, _, name in rows if not name.startswith(" ")) / 1000
+    loaded = {name.strip().split(".")[0] for _, _, name in rows}
+    eager = [name for name in LAZY_MODULES if name in loaded]
+
+    print(f"import {args.module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    for cumulative, _, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name.strip()}")
+
+    ok = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: import time {total_ms:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+        ok = False
+    if eager:
+        print(f"FAIL: {', '.join(eager)} imported at startup (must be lazy)")
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
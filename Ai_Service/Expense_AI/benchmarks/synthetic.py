@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+# Danh mục chi tiêu mặc định (BackEnd/data/categoriesGlobal.json) và mức chi điển hình (VND)
+EXPENSE_CATEGORIES = {
+    "Rent/Mortgage": 450000,
+    "Utilities": 180000,
+    "Groceries": 220000,
+    "Transportation": 120000,
+    "Insurance": 300000,
+    "Healthcare": 250000,
+    "Entertainment": 200000,
+    "Shopping": 280000,
+    "Other": 150000,
+}
+
+
+def generate_history(n_rows, n_users=1, months=24, seed=42, end=None):
+    """
+    Sinh lịch sử chi tiêu giả lập giống BackEnd/expenses_seed.json:
+    cột userId (ObjectId 24 ký tự hex), date ('YYYY-MM-DD'), amount, category.
+    Mỗi người dùng có mức chi riêng, có xu hướng nhẹ theo thời gian.
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end or pd.Timestamp.now().normalize())
+    start = end - pd.DateOffset(months=months)
+    span_days = (end - start).days
+
+    user_ids = np.array([f"{0x68e45fb9fc9a3ce15d000000 + i:024x}" for i in range(n_users)])
+    user_idx = rng.integers(0, n_users, n_rows)
+    user_scale = rng.lognormal(0.0, 0.3, n_users)
+
+    names = np.array(list(EXPENSE_CATEGORIES))
+    base = np.array(list(EXPENSE_CATEGORIES.values()), dtype=float)
+    cat_idx = rng.integers(0, len(names), n_rows)
+
+    day = rng.integers(0, span_days + 1, n_rows)
+    trend = 1.0 + 0.15 * day / max(span_days, 1)
+    amount = base[cat_idx] * user_scale[user_idx] * trend * rng.lognormal(0.0, 0.35, n_rows)
+
+    dates = (start + pd.to_timedelta(day, unit="D")).strftime("%Y-%m-%d")
+    return pd.DataFrame({
+        "userId": user_ids[user_idx],
+        "date": np.asarray(dates),
+        "amount": np.round(amount, -2),
+        "category": names[cat_idx],
+    })
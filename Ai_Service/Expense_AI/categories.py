@@ -0,0 +1,96 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+GROUPS = ("Necessary", "Other", "Unnecessary")
+NECESSARY, OTHER, UNNECESSARY = range(len(GROUPS))
+
+DEFAULT_NECESSARY = ("Rent/Mortgage", "Utilities", "Groceries", "Transportation", "Insurance", "Healthcare")
+DEFAULT_UNNECESSARY = ("Entertainment", "Shopping")
+
+# dtype dùng chung cho cột nhóm: mã 0/1/2 theo thứ tự GROUPS
+GROUP_DTYPE = pd.CategoricalDtype(GROUPS)
+
+
+# -----------------------------------
+# 🏷️ Bảng tra category -> nhóm chi tiêu
+# -----------------------------------
+class CategoryRegistry:
+    """
+    Ánh xạ category -> nhóm (Necessary / Other / Unnecessary).
+    Phân loại cả cột bằng mã categorical: chỉ tra bảng trên các giá trị duy nhất,
+    sau đó lấy mã nhóm theo mảng chỉ số.
+    """
+
+    def __init__(self, necessary=DEFAULT_NECESSARY, unnecessary=DEFAULT_UNNECESSARY):
+        self.necessary = frozenset(necessary)
+        self.unnecessary = frozenset(unnecessary) - self.necessary
+        self._codes = {category: NECESSARY for category in self.necessary}
+        self._codes.update({category: UNNECESSARY for category in self.unnecessary})
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        config: {"necessary": [...], "unnecessary": [...]}; thiếu khoá nào thì dùng mặc định.
+        Sai định dạng -> ValueError.
+        """
+        if not isinstance(config, dict):
+            raise ValueError("expected an object {\"necessary\": [...], \"unnecessary\": [...]}")
+        groups = {}
+        for key, default in (("necessary", DEFAULT_NECESSARY), ("unnecessary", DEFAULT_UNNECESSARY)):
+            categories = config.get(key, default)
+            if not isinstance(categories, (list, tuple)) or not all(isinstance(c, str) for c in categories):
+                raise ValueError(f"'{key}' must be a list of category names")
+            groups[key] = categories
+        return cls(**groups)
+
+    def classify(self, category):
+        return GROUPS[self._codes.get(category, OTHER)]
+
+    def group_codes(self, categories):
+        """
+        Mảng mã nhóm (int8) cho một cột category.
+        """
+        if isinstance(categories.dtype, pd.CategoricalDtype):
+            codes, uniques = categories.cat.codes.to_numpy(), categories.cat.categories
+        else:
+            codes, uniques = pd.factorize(categories)
+        lookup = np.fromiter(
+            (self._codes.get(category, OTHER) for category in uniques), dtype=np.int8, count=len(uniques)
+        )
+        # Mã -1 (giá trị thiếu) rơi vào phần tử cuối -> thêm OTHER ở cuối bảng tra
+        return np.append(lookup, np.int8(OTHER))[codes]
+
+    def classify_series(self, categories):
+        """
+        Phân loại cả cột category thành Series categorical (dtype GROUP_DTYPE).
+        """
+        codes = self.group_codes(categories)
+        return pd.Series(
+            pd.Categorical.from_codes(codes, dtype=GROUP_DTYPE), index=categories.index, name="group"
+        )
+
+
+def load_default_registry():
+    """
+    Bảng tra mặc định của deployment: đọc file JSON trong CATEGORY_CONFIG nếu có.
+    """
+    path = os.environ.get("CATEGORY_CONFIG")
+    if not path:
+        return CategoryRegistry()
+    with open(path, encoding="utf-8") as f:
+        return CategoryRegistry.from_config(json.load(f))
+
+
+default_registry = load_default_registry()
+
+
+def resolve_registry(config=None):
+    """
+    Bảng tra cho một request: cấu hình riêng của người dùng hoặc mặc định.
+    """
+    if not config:
+        return default_registry
+    return CategoryRegistry.from_config(config)
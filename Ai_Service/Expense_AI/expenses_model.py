@@ -2,227 +2,690 @@ import pandas as pd
 import numpy as np
 from datetime import datetime         
 from dateutil.relativedelta import relativedelta
-from sklearn.ensemble import RandomForestRegressor
-from scipy.optimize import linprog
+from forecasters import ENGINES, VECTORIZED_ENGINES, fit_forests, forecast_matrix
+from allocator import SOLVERS, greedy_ratios, group_weights_and_bounds, linprog_ratios
+from categories import GROUPS, OTHER, UNNECESSARY, default_registry
+from model_cache import forecast_cache, group_fingerprints, row_hashes
+from metrics import ROWS, stage
+from nowcast import NowcastState, check_transaction_level, month_position, spend_profile
 import warnings
 
 warnings.filterwarnings("ignore")
 
-# 1️⃣ Category classification (Không đổi)
+# 1️⃣ Category classification (bảng tra trong categories.py, cấu hình được)
 def classify_category(category):
-    necessary = ["Rent/Mortgage", "Utilities", "Groceries", "Transportation", "Insurance", "Healthcare"]
-    unnecessary = ["Entertainment", "Shopping"]
+    return default_registry.classify(category)
 
-    if category in necessary:
-        return "Necessary"
-    elif category in unnecessary:
-        return "Unnecessary"
+# 2️⃣ Evaluate expenses (ĐÃ SỬA)
+def _parse_dates(values):
+    """
+    Parse cột ngày cho mọi endpoint. Ngày có timezone (ISO '...Z' của backend) được đưa về
+    giờ địa phương của chính nó (bỏ tz) để so sánh được với mốc tháng không có tz.
+    """
+    dates = pd.to_datetime(values)
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates
+
+
+def _month_index(dates):
+    """
+    Chuyển cột ngày thành chỉ số tháng nguyên (year * 12 + month - 1).
+    Ngày không có timezone được tính thẳng trên mảng datetime64 (không tạo cột year/month trung gian).
+    """
+    if dates.dt.tz is not None:
+        return dates.dt.year * 12 + dates.dt.month - 1
+    months = dates.to_numpy().astype("datetime64[M]").astype(np.int64) + 1970 * 12
+    return pd.Series(months, index=dates.index, name=dates.name)
+
+
+def _rows_between(dates, start, end):
+    """
+    Vị trí các dòng có start <= date < end.
+    Dữ liệu thường đã sắp xếp theo ngày (tăng hoặc giảm) -> dùng searchsorted thay vì quét toàn bộ.
+    """
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    values = dates.to_numpy()
+    start, end = np.datetime64(start, "ns"), np.datetime64(end, "ns")
+    if dates.is_monotonic_increasing:
+        return np.arange(values.searchsorted(start, "left"), values.searchsorted(end, "left"))
+    if dates.is_monotonic_decreasing:
+        reversed_values = values[::-1]
+        lo = len(values) - reversed_values.searchsorted(end, "left")
+        hi = len(values) - reversed_values.searchsorted(start, "left")
+        return np.arange(lo, hi)
+    return np.flatnonzero((values >= start) & (values < end))
+
+
+def _category_totals(df, rows, registry):
+    """
+    Tổng theo category của các dòng được chọn (một phép groupby duy nhất),
+    kèm mã nhóm của từng category.
+    """
+    with stage("aggregate"):
+        per_category = (
+            df['amount'].iloc[rows]
+            .groupby(df['category'].iloc[rows], sort=False, dropna=False)
+            .sum()
+        )
+    with stage("classify"):
+        group_codes = registry.group_codes(per_category.index.to_series())
+    return per_category, group_codes
+
+
+def _score_month(month_year_to_eval, total_expenses, unnecessary_sum, category_summary,
+                 prev_total_expenses, monthly_budget, monthly_income):
+    """
+    Chấm điểm một tháng (budget / category / trend / savings / top category).
+    category_summary: tổng theo category, đã sắp xếp giảm dần.
+    """
+    unnecessary_ratio = unnecessary_sum / total_expenses if total_expenses > 0 else 0
+    category_status = "Good" if unnecessary_ratio <= 0.3 else "Too much unnecessary spending"
+
+    budget_status = "Good" if total_expenses <= monthly_budget else "Exceeded"
+    trend = (total_expenses - prev_total_expenses) / prev_total_expenses if prev_total_expenses > 0 else 0
+    trend_status = "Decreased" if trend < 0 else "Increased" if trend > 0 else "Stable"
+
+    savings_ratio = 1 - (total_expenses / monthly_income) if monthly_income > 0 else 0
+    savings_status = "Good" if savings_ratio >= 0.2 else "Low"
+
+    # Thêm kiểm tra nếu category_summary rỗng
+    if category_summary.empty:
+        top_category = "N/A"
+        top_ratio = 0
+        top_status = "Normal"
     else:
-        return "Other"
+        top_category = category_summary.index[0]
+        top_ratio = category_summary.iloc[0] / total_expenses if total_expenses > 0 else 0
+        top_status = "Warning" if top_ratio > 0.3 else "Normal"
+
+    score = sum([
+        budget_status == "Good",
+        category_status == "Good",
+        trend_status in ["Decreased", "Stable"],
+        savings_status == "Good",
+        top_status == "Normal"
+    ])
+    overall_status = (
+        "Good" if score >= 4 else
+        "Needs improvement" if score >= 2 else
+        "Poor"
+    )
+
+    return {
+        "month_evaluated": month_year_to_eval, # Thêm thông tin tháng nào được đánh giá
+        "total_expenses": total_expenses,
+        "budget_status": budget_status,
+        "unnecessary_ratio": f"{unnecessary_ratio:.2%}",
+        "category_status": category_status,
+        "trend": f"{trend:.2%} ({trend_status})",
+        "savings_ratio": f"{savings_ratio:.2%} ({savings_status})",
+        "top_category": f"{top_category} ({top_ratio:.2%}) - {top_status}",
+        "overall_status": overall_status,
+        "category_summary": category_summary.to_dict()
+    }
+
+
+def _last_month_start():
+    today = datetime.now()
+    return (today - relativedelta(months=1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _evaluate_month(df, dates, monthly_budget, monthly_income, prev_total_expenses, registry):
+    """
+    Đánh giá tháng trước trên records có cột ngày đã parse (dates).
+    """
+    # TỰ ĐỘNG LẤY THÁNG TRƯỚC ĐỂ ĐÁNH GIÁ
+    month_start = _last_month_start()
+    month_year_to_eval = month_start.strftime('%Y-%m')
+
+    # Sử dụng tháng đã tính toán (so sánh theo khoảng ngày, không format chuỗi)
+    rows = _rows_between(dates, month_start, month_start + relativedelta(months=1))
+    
+    if len(rows) == 0:
+        # Cập nhật thông báo lỗi
+        return {"error": f"Không tìm thấy dữ liệu cho tháng trước ({month_year_to_eval})"}
+
+    per_category, group_codes = _category_totals(df, rows, registry)
+    total_expenses = per_category.sum()
+    unnecessary_sum = per_category[group_codes == UNNECESSARY].sum()
+    category_summary = per_category[per_category.index.notna()].sort_values(ascending=False)
+    return _score_month(
+        month_year_to_eval, total_expenses, unnecessary_sum, category_summary,
+        prev_total_expenses, monthly_budget, monthly_income
+    )
+
 
-# 2️⃣ Evaluate expenses (ĐÃ SỬA)
 # Xóa 'month_year' khỏi tham số
-def evaluate_expenses(df, monthly_budget=2000, monthly_income=3000, prev_total_expenses=1800):
+def evaluate_expenses(df, monthly_budget=2000, monthly_income=3000, prev_total_expenses=1800, registry=None):
     """
     Đánh giá chi tiêu cho tháng trước đó (tự động).
+    registry: CategoryRegistry riêng của người dùng (mặc định: default_registry).
     """
+    registry = registry or default_registry
+    ROWS.inc(len(df), "evaluate_expenses")
     try:
-        # TỰ ĐỘNG LẤY THÁNG TRƯỚC ĐỂ ĐÁNH GIÁ
-        today = datetime.now()
-        last_month_date = today - relativedelta(months=1)
-        month_year_to_eval = last_month_date.strftime('%Y-%m')
-        
-        df['date'] = pd.to_datetime(df['date'])
-        # Sử dụng tháng đã tính toán
-        df_month = df[df['date'].dt.strftime('%Y-%m') == month_year_to_eval]
-        
-        if df_month.empty:
-            # Cập nhật thông báo lỗi
-            return {"error": f"Không tìm thấy dữ liệu cho tháng trước ({month_year_to_eval})"}
-
-        total_expenses = df_month['amount'].sum()
-        df_month['type'] = df_month['category'].apply(classify_category)
-        necessary_sum = df_month[df_month['type'] == 'Necessary']['amount'].sum()
-        unnecessary_sum = df_month[df_month['type'] == 'Unnecessary']['amount'].sum()
-        unnecessary_ratio = unnecessary_sum / total_expenses if total_expenses > 0 else 0
-        category_status = "Good" if unnecessary_ratio <= 0.3 else "Too much unnecessary spending"
-
-        budget_status = "Good" if total_expenses <= monthly_budget else "Exceeded"
-        trend = (total_expenses - prev_total_expenses) / prev_total_expenses if prev_total_expenses > 0 else 0
-        trend_status = "Decreased" if trend < 0 else "Increased" if trend > 0 else "Stable"
-
-        savings_ratio = 1 - (total_expenses / monthly_income) if monthly_income > 0 else 0
-        savings_status = "Good" if savings_ratio >= 0.2 else "Low"
-
-        category_summary = df_month.groupby('category')['amount'].sum().sort_values(ascending=False)
-        
-        # Thêm kiểm tra nếu category_summary rỗng
-        if category_summary.empty:
-            top_category = "N/A"
-            top_ratio = 0
-            top_status = "Normal"
-        else:
-            top_category = category_summary.index[0]
-            top_ratio = category_summary.iloc[0] / total_expenses if total_expenses > 0 else 0
-            top_status = "Warning" if top_ratio > 0.3 else "Normal"
-
-        score = sum([
-            budget_status == "Good",
-            category_status == "Good",
-            trend_status in ["Decreased", "Stable"],
-            savings_status == "Good",
-            top_status == "Normal"
-        ])
-        overall_status = (
-            "Good" if score >= 4 else
-            "Needs improvement" if score >= 2 else
-            "Poor"
-        )
+        with stage("parse_dates"):
+            dates = _parse_dates(df['date'])
+        return _evaluate_month(df, dates, monthly_budget, monthly_income, prev_total_expenses, registry)
+
+    except Exception as e:
+        return {"error": str(e)}
+
+
+MAX_RANGE_MONTHS = 120
+
+
+def _parse_month(month):
+    """
+    'YYYY-MM' -> chỉ số tháng nguyên.
+    """
+    year, month_num = (int(part) for part in str(month).split("-")[:2])
+    if not 1 <= month_num <= 12:
+        raise ValueError(f"Invalid month '{month}'")
+    return year * 12 + month_num - 1
+
+
+def _month_label(month_idx):
+    return f"{month_idx // 12:04d}-{month_idx % 12 + 1:02d}"
+
+
+def evaluate_expenses_range(df, from_month=None, to_month=None, monthly_budget=2000, monthly_income=3000, registry=None):
+    """
+    Đánh giá từng tháng trong khoảng [from_month, to_month] ('YYYY-MM'; mặc định 12 tháng,
+    kết thúc ở tháng trước). Xu hướng của mỗi tháng so với tổng chi của tháng liền trước,
+    lấy trực tiếp từ records. Tổng theo (tháng, category) được tính trong một lần bincount.
+    """
+    registry = registry or default_registry
+    ROWS.inc(len(df), "evaluate_expenses_range")
+    try:
+        if to_month is None:
+            last_month = datetime.now() - relativedelta(months=1)
+            to_month = last_month.strftime('%Y-%m')
+        to_key = _parse_month(to_month)
+        from_key = _parse_month(from_month) if from_month is not None else to_key - 11
+        if from_key > to_key:
+            return {"error": "'from' must not be after 'to'"}
+        if to_key - from_key + 1 > MAX_RANGE_MONTHS:
+            return {"error": f"Range too long (max {MAX_RANGE_MONTHS} months)"}
+
+        # Thêm tháng liền trước 'from' để tính xu hướng của tháng đầu tiên
+        first_key = from_key - 1
+        n_months = to_key - first_key + 1
 
-        return {
-            "month_evaluated": month_year_to_eval, # Thêm thông tin tháng nào được đánh giá
-            "total_expenses": total_expenses,
-            "budget_status": budget_status,
-            "unnecessary_ratio": f"{unnecessary_ratio:.2%}",
-            "category_status": category_status,
-            "trend": f"{trend:.2%} ({trend_status})",
-            "savings_ratio": f"{savings_ratio:.2%} ({savings_status})",
-            "top_category": f"{top_category} ({top_ratio:.2%}) - {top_status}",
-            "overall_status": overall_status,
-            "category_summary": category_summary.to_dict()
-        }
+        with stage("parse_dates"):
+            month = _month_index(_parse_dates(df['date'])).to_numpy()
+        rows = np.flatnonzero((month >= first_key) & (month <= to_key))
+        with stage("aggregate"):
+            cat_codes, cat_names = pd.factorize(df['category'].to_numpy()[rows])
+            n_cats = len(cat_names) + 1
+            cat_codes[cat_codes < 0] = n_cats - 1  # category thiếu -> cột cuối
+
+            flat = (month[rows] - first_key) * n_cats + cat_codes
+            amounts = np.bincount(flat, weights=df['amount'].to_numpy(dtype=float)[rows], minlength=n_months * n_cats)
+            counts = np.bincount(flat, minlength=n_months * n_cats)
+            amounts = amounts.reshape(n_months, n_cats)
+            present = counts.reshape(n_months, n_cats) > 0
+
+        with stage("classify"):
+            group_codes = np.append(registry.group_codes(pd.Series(cat_names, dtype=object)), OTHER)
+        totals = amounts.sum(axis=1)
+        unnecessary = amounts[:, group_codes == UNNECESSARY].sum(axis=1)
+
+        months = []
+        for i in range(1, n_months):
+            label = _month_label(first_key + i)
+            if not present[i].any():
+                months.append({"month_evaluated": label, "error": f"Không tìm thấy dữ liệu cho tháng {label}"})
+                continue
+            named = np.flatnonzero(present[i, :-1])
+            order = named[np.argsort(-amounts[i, named], kind="stable")]
+            category_summary = pd.Series(amounts[i, order], index=cat_names[order])
+            months.append(_score_month(
+                label, totals[i], unnecessary[i], category_summary,
+                totals[i - 1], monthly_budget, monthly_income
+            ))
+
+        return {"from": _month_label(from_key), "to": _month_label(to_key), "months": months}
 
     except Exception as e:
         return {"error": str(e)}
 
 # 3️⃣ Prediction (ĐÃ SỬA)
-def predict_next_month_by_group(df):
+def _group_insight(group, predicted, std, last_month_value):
+    """
+    Tạo kết quả dự đoán (trend, emoji, message) cho một nhóm.
+    """
+    confidence = 1.96 * std
+
+    # 🔍 Compare predicted vs last month spending
+    diff_ratio = (predicted - last_month_value) / last_month_value if last_month_value > 0 else 0
+
+    # 🎯 Generate more diverse insights
+    if diff_ratio > 0.2:
+        trend = "increasing_strong"
+        emoji = "🚨"
+        # EN: Sharp increase — warning user
+        # VI: Tăng mạnh — cảnh báo người dùng nên xem lại chi tiêu
+        message = (
+            f"{emoji} Spending in **{group.lower()}** is projected to rise sharply (**+{diff_ratio:.1%}**) compared to last month. "
+            "This could strain your budget — consider reviewing or reducing non-essential expenses."
+        )
+    elif 0.05 < diff_ratio <= 0.2:
+        trend = "increasing_mild"
+        emoji = "📈"
+        # EN: Slight increase — monitor spending
+        # VI: Tăng nhẹ — nên theo dõi để tránh vượt ngân sách
+        message = (
+            f"{emoji} Spending in **{group.lower()}** is expected to increase slightly (**+{diff_ratio:.1%}**). "
+            "Keep an eye on this category to ensure it stays within your limits."
+        )
+    elif -0.2 <= diff_ratio < -0.05:
+        trend = "decreasing_mild"
+        emoji = "📉"
+        # EN: Mild decrease — good progress
+        # VI: Giảm nhẹ — dấu hiệu tích cực, nên duy trì
+        message = (
+            f"{emoji} Spending in **{group.lower()}** shows a moderate decrease (**{diff_ratio:.1%}**). "
+            "Good progress — maintaining this trend can improve your savings rate."
+        )
+    elif diff_ratio < -0.2:
+        trend = "decreasing_strong"
+        emoji = "💪"
+        # EN: Strong decrease — excellent result
+        # VI: Giảm mạnh — kết quả rất tốt, người dùng kiểm soát chi tiêu hiệu quả
+        message = (
+            f"{emoji} Excellent! Spending in **{group.lower()}** is projected to drop significantly (**{abs(diff_ratio):.1%}**). "
+            "You're managing your budget efficiently — keep it up!"
+        )
+    else:
+        trend = "stable"
+        emoji = "⚖️"
+        # EN: Stable — consistent spending
+        # VI: Ổn định — chi tiêu đều đặn, tốt cho quản lý tài chính lâu dài
+        message = (
+            f"{emoji} Spending in **{group.lower()}** is expected to remain stable, with no major fluctuations. "
+            "Consistency is a key part of financial stability."
+        )
+
+    return {
+        "group": group,
+        "predicted": round(predicted, 2),
+        "confidence": round(confidence, 2),
+        "trend": trend,
+        "emoji": emoji,
+        "message": message
+    }
+
+
+def _forecast_series(monthly_sum, engine="forest", executor=None):
+    """
+    Dự đoán tháng kế tiếp cho mọi chuỗi trong monthly_sum
+    (Series có MultiIndex kết thúc bằng level 'month').
+    Trả về danh sách (key, kết quả); key là group hoặc (user, group).
+    executor: Executor để huấn luyện các forest song song (mặc định theo FOREST_EXECUTOR).
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'. Expected one of {', '.join(ENGINES)}")
+
+    matrix = monthly_sum.unstack("month")
+    if engine in VECTORIZED_ENGINES:
+        # Các engine vector hoá cần các cột tháng liên tiếp
+        matrix = matrix.reindex(columns=np.arange(matrix.columns.min(), matrix.columns.max() + 1))
+
+    months = matrix.columns.to_numpy()
+    Y = matrix.to_numpy(dtype=float)
+    mask = ~np.isnan(Y)
+    counts = mask.sum(axis=1)
+    last_values = Y[np.arange(len(Y)), np.where(mask, np.arange(Y.shape[1]), -1).max(axis=1)]
+
+    if engine == "forest":
+        predicted = np.zeros(len(Y))
+        std = np.zeros(len(Y))
+        fit_rows = np.flatnonzero(counts >= 3)
+        fits = fit_forests([(months[mask[i]], Y[i, mask[i]]) for i in fit_rows], executor)
+        if fits:
+            predicted[fit_rows], std[fit_rows] = np.array(fits).T
+    else:
+        predicted, std = forecast_matrix(Y, engine)
+
+    results = []
+    for i, key in enumerate(matrix.index):
+        group = key[-1] if isinstance(key, tuple) else key
+        if counts[i] < 3:
+            result = {
+                "group": group,
+                "predicted": Y[i, mask[i]].mean(),
+                "confidence": 0,
+                "message": "Not enough data (used mean)"
+            }
+        else:
+            result = _group_insight(group, predicted[i], std[i], last_values[i])
+        results.append((key, result))
+    return results
+
+
+def _forecast_by_user(monthly_sum, current_month, engine="forest", executor=None):
+    """
+    Dự đoán cho từng người dùng (monthly_sum có index (user, group, month), đã sắp xếp),
+    dùng lại kết quả trong forecast_cache khi lịch sử tổng theo tháng không đổi.
+    Trả về {user: [kết quả theo nhóm]}.
+    """
+    users = monthly_sum.index.get_level_values("user").to_numpy()
+    hashes = row_hashes(monthly_sum.droplevel("user"))
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    ends = np.r_[starts[1:], len(users)]
+
+    keys = group_fingerprints(hashes, starts, current_month, engine)
+    cached = forecast_cache.get_many(keys)
+    missing = np.array([value is None for value in cached])
+
+    if missing.any():
+        # Các dòng của user chưa có trong cache: mỗi user là một đoạn liên tiếp starts..ends
+        subset = monthly_sum[np.repeat(missing, ends - starts)]
+        fresh = {}
+        with stage("forecast"):
+            forecasts = _forecast_series(subset, engine, executor)
+        for (user, _), result in forecasts:
+            fresh.setdefault(user, []).append(result)
+        for i in np.flatnonzero(missing):
+            cached[i] = fresh[users[starts[i]]]
+            forecast_cache.put(keys[i], cached[i])
+    return {user: [dict(result) for result in user_results] for user, user_results in zip(users[starts], cached)}
+
+
+def predict_next_month_by_group(df, engine="forest", registry=None, executor=None):
     """
     Dự đoán chi tiêu cho THÁNG HIỆN TẠI
     dựa trên tất cả dữ liệu lịch sử TRƯỚC ngày 1 của tháng này.
+    engine: "forest" | "linear" | "ewma" | "seasonal_naive" | "online".
+    executor: Executor huấn luyện forest song song theo nhóm (mặc định theo FOREST_EXECUTOR).
     """
+    registry = registry or default_registry
+    ROWS.inc(len(df), "predict_next_month_by_group")
     try:
         # LẤY MỐC THỜI GIAN HIỆN TẠI
         today = datetime.now()
         first_of_current_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        df['date'] = pd.to_datetime(df['date'])
-        
+
+        # Không sửa df của người gọi và không copy cả bảng: chỉ lấy các cột cần dùng
+        with stage("parse_dates"):
+            dates = _parse_dates(df['date'])
+
         # LỌC DỮ LIỆU: Chỉ sử dụng dữ liệu TRƯỚC tháng hiện tại
-        df_historical = df[df['date'] < first_of_current_month].copy()
-        
-        if df_historical.empty:
+        historical = (dates < first_of_current_month).to_numpy()
+
+        if not historical.any():
             return pd.DataFrame([{"error": "Không có dữ liệu lịch sử (trước tháng này) để dự đoán."}])
 
-        # Thực hiện trên df_historical
-        df_historical['group'] = df_historical['category'].apply(classify_category)
-        df_historical['month'] = df_historical['date'].dt.to_period('M')
-
-        results = []
-        # Thực hiện trên df_historical
-        for group, group_data in df_historical.groupby('group'):
-            monthly_sum = group_data.groupby('month')['amount'].sum().reset_index()
-            monthly_sum['month'] = monthly_sum['month'].dt.to_timestamp()
-            monthly_sum['month_num'] = (
-                (monthly_sum['month'].dt.year - monthly_sum['month'].dt.year.min()) * 12 +
-                (monthly_sum['month'].dt.month - monthly_sum['month'].dt.month.min())
+        with stage("classify"):
+            groups = registry.classify_series(df['category']).array[historical]
+        months = _month_index(dates).to_numpy()[historical]
+        amounts = df['amount'].to_numpy(dtype=float)[historical]
+
+        return _predict_grouped(amounts, groups, months, first_of_current_month, engine, executor)
+    except Exception as e:
+        return pd.DataFrame([{"error": str(e)}])
+
+
+def predict_from_online_states(states, month=None):
+    """
+    Dự đoán cho tháng `month` (mặc định tháng hiện tại) đọc thẳng từ trạng thái
+    OnlineForecaster theo nhóm (xem online.py), không xử lý lại lịch sử.
+    Cùng kết quả với engine "online" trên records có cùng tổng theo tháng.
+    """
+    if month is None:
+        today = datetime.now()
+        month = today.year * 12 + today.month - 1
+
+    results = []
+    for group in GROUPS:
+        state = states.get(group)
+        if state is None:
+            continue
+        state.advance(month)
+        if state.count == 0:
+            continue
+        if state.count < 3:
+            results.append({
+                "group": group,
+                "predicted": state.total / state.count,
+                "confidence": 0,
+                "message": "Not enough data (used mean)"
+            })
+        else:
+            predicted, std = state.predict()
+            results.append(_group_insight(group, predicted, std, state.last_value))
+    if not results:
+        return pd.DataFrame([{"error": "Không có dữ liệu lịch sử (trước tháng này) để dự đoán."}])
+    return pd.DataFrame(results)
+
+
+def _monthly_group_sum(amounts, groups, months):
+    """
+    Tổng theo (group, month) bằng một lần bincount trên ma trận dày nhóm × tháng.
+    amounts: mảng float, groups: Categorical (GROUP_DTYPE), months: mảng chỉ số tháng.
+    Trả về Series index (group, month) chỉ gồm các ô có dữ liệu, giống groupby(observed=True).
+    """
+    codes = np.asarray(groups.codes, dtype=np.int64)
+    first = months.min()
+    n_months = months.max() - first + 1
+    size = len(groups.categories) * n_months
+    flat = codes * n_months + (months - first)
+
+    # Giống groupby.sum: bỏ qua amount NaN nhưng ô vẫn được tính là có dữ liệu
+    weights = np.where(np.isnan(amounts), 0.0, amounts) if np.isnan(amounts).any() else amounts
+    sums = np.bincount(flat, weights=weights, minlength=size)
+    cells = np.flatnonzero(np.bincount(flat, minlength=size))
+    index = pd.MultiIndex.from_arrays(
+        [pd.Categorical.from_codes(cells // n_months, dtype=groups.dtype), cells % n_months + first],
+        names=["group", "month"],
+    )
+    return pd.Series(sums[cells], index=index, name="amount")
+
+
+def _predict_grouped(amounts, groups, months, first_of_current_month, engine="forest", executor=None):
+    """
+    Dự đoán từ các mảng lịch sử đã căn chỉnh: số tiền, nhóm và chỉ số tháng.
+    """
+    with stage("aggregate"):
+        monthly_sum = _monthly_group_sum(amounts, groups, months)
+    monthly_sum = pd.concat({"": monthly_sum}, names=["user"])
+    results = _forecast_by_user(monthly_sum, first_of_current_month.strftime('%Y-%m'), engine, executor)
+    return pd.DataFrame(results[""])
+
+
+def predict_next_month_hierarchical(df, engine="linear", registry=None):
+    """
+    Dự đoán tháng hiện tại cho TỪNG category rồi cộng dồn lên nhóm (bottom-up),
+    nên tổng các category luôn khớp với dự đoán của nhóm.
+    Mọi category được dự đoán trong một lần gọi engine vector hoá trên ma trận category × tháng
+    (engine: "linear" | "ewma" | "seasonal_naive" | "online"; forest cần một model mỗi chuỗi nên không hỗ trợ).
+    std của nhóm = sqrt(tổng phương sai các category), coi sai số các category là độc lập.
+    Trả về {"groups": [...], "categories": [...]}.
+    """
+    registry = registry or default_registry
+    ROWS.inc(len(df), "predict_next_month_hierarchical")
+    try:
+        if engine not in VECTORIZED_ENGINES:
+            raise ValueError(f"Hierarchical forecasts require one of {', '.join(VECTORIZED_ENGINES)}")
+
+        today = datetime.now()
+        first_of_current_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        with stage("parse_dates"):
+            dates = _parse_dates(df['date'])
+        historical = (dates < first_of_current_month).to_numpy()
+        if not historical.any():
+            return {"error": "Không có dữ liệu lịch sử (trước tháng này) để dự đoán."}
+
+        with stage("aggregate"):
+            # Category thiếu được giữ thành một category riêng (tên null, nhóm Other)
+            cat_codes, cat_names = pd.factorize(
+                df['category'].to_numpy(dtype=object)[historical], sort=True, use_na_sentinel=False
             )
+            months = _month_index(dates).to_numpy()[historical]
+            amounts = df['amount'].to_numpy(dtype=float)[historical]
+            first = months.min()
+            n_cats, n_months = len(cat_names), months.max() - first + 1
+            flat = cat_codes * n_months + (months - first)
+
+            sums = np.bincount(flat, weights=np.nan_to_num(amounts), minlength=n_cats * n_months)
+            mask = (np.bincount(flat, minlength=n_cats * n_months) > 0).reshape(n_cats, n_months)
+            Y = np.where(mask, sums.reshape(n_cats, n_months), np.nan)
+
+        with stage("classify"):
+            group_codes = registry.group_codes(pd.Series(cat_names, dtype=object))
+
+        with stage("forecast"):
+            predicted, std = forecast_matrix(Y, engine)
 
-            if len(monthly_sum) < 3:
-                results.append({
-                    "group": group,
-                    "predicted": monthly_sum['amount'].mean(),
+        # Ít hơn 3 tháng có dữ liệu -> dùng trung bình như predict_next_month_by_group
+        counts = mask.sum(axis=1)
+        few = counts < 3
+        Y0 = np.where(mask, Y, 0.0)
+        predicted = np.where(few, Y0.sum(axis=1) / np.maximum(counts, 1), predicted)
+        std = np.where(few, 0.0, std)
+        last = np.where(mask, np.arange(n_months), -1).max(axis=1)
+        last_values = Y[np.arange(n_cats), last]
+
+        # Cộng dồn lên nhóm: ma trận nhóm × tháng = tổng các dòng category cùng nhóm
+        membership = np.zeros((len(GROUPS), n_cats))
+        membership[group_codes, np.arange(n_cats)] = 1.0
+        group_Y = membership @ Y0
+        group_mask = (membership @ mask) > 0
+        group_predicted = membership @ predicted
+        group_std = np.sqrt(membership @ (std * std))
+        group_counts = group_mask.sum(axis=1)
+        group_last = np.where(group_mask, np.arange(n_months), -1).max(axis=1)
+
+        groups = []
+        for g in np.flatnonzero(group_counts):
+            if group_counts[g] < 3:
+                groups.append({
+                    "group": GROUPS[g],
+                    "predicted": group_predicted[g],
                     "confidence": 0,
                     "message": "Not enough data (used mean)"
                 })
-                continue
+            else:
+                last_value = group_Y[g, group_last[g]]
+                groups.append(_group_insight(GROUPS[g], group_predicted[g], group_std[g], last_value))
+
+        categories = []
+        for i in np.lexsort((-predicted, group_codes)):
+            name = None if pd.isna(cat_names[i]) else cat_names[i]
+            if few[i]:
+                insight = {"predicted": predicted[i], "confidence": 0, "message": "Not enough data (used mean)"}
+            else:
+                insight = _group_insight(str(name), predicted[i], std[i], last_values[i])
+                del insight["group"]
+            categories.append({"category": name, "group": GROUPS[group_codes[i]], **insight})
+
+        return {"groups": groups, "categories": categories}
+    except Exception as e:
+        return {"error": str(e)}
+
 
-            X = monthly_sum[['month_num']]
-            y = monthly_sum['amount']
-            model = RandomForestRegressor(n_estimators=100, random_state=42)
-            model.fit(X, y)
+def predict_next_month_batch(df, user_col="userId", engine="forest", registry=None, executor=None):
+    """
+    Dự đoán chi tiêu tháng hiện tại cho NHIỀU người dùng trong một lần gọi.
+    Gom nhóm (user, group, month) bằng một phép groupby duy nhất rồi trả về
+    {userId: [kết quả theo nhóm]} với cùng định dạng như predict_next_month_by_group.
+    """
+    registry = registry or default_registry
+    ROWS.inc(len(df), "predict_next_month_batch")
+    try:
+        today = datetime.now()
+        first_of_current_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        with stage("parse_dates"):
+            dates = _parse_dates(df['date'])
+        # userId thiếu không thuộc về user nào (không thành user "nan")
+        known = df[user_col].notna().to_numpy()
+        users = df[user_col].astype(str)
+        historical = (dates < first_of_current_month).to_numpy() & known
 
-            last_date = monthly_sum['month'].max()
-            next_month = last_date + relativedelta(months=1)
-            next_month_num = (
-                (next_month.year - monthly_sum['month'].dt.year.min()) * 12 +
-                (next_month.month - monthly_sum['month'].dt.month.min())
+        with stage("classify"):
+            groups = registry.classify_series(df.loc[historical, 'category'])
+        with stage("aggregate"):
+            monthly_sum = (
+                pd.DataFrame({
+                    "user": users[historical],
+                    "group": groups,
+                    "month": _month_index(dates[historical]),
+                    "amount": df.loc[historical, 'amount'],
+                })
+                .groupby(["user", "group", "month"], sort=True, observed=True)['amount']
+                .sum()
             )
 
-            predicted = model.predict([[next_month_num]])[0]
-            residuals = y - model.predict(X)
-            std = np.std(residuals)
-            confidence = 1.96 * std
-
-            # 🔍 Compare predicted vs last month spending
-            last_month_value = y.iloc[-1]
-            diff_ratio = (predicted - last_month_value) / last_month_value if last_month_value > 0 else 0
-
-            # 🎯 Generate more diverse insights
-            if diff_ratio > 0.2:
-                trend = "increasing_strong"
-                emoji = "🚨"
-                # EN: Sharp increase — warning user
-                # VI: Tăng mạnh — cảnh báo người dùng nên xem lại chi tiêu
-                message = (
-                    f"{emoji} Spending in **{group.lower()}** is projected to rise sharply (**+{diff_ratio:.1%}**) compared to last month. "
-                    "This could strain your budget — consider reviewing or reducing non-essential expenses."
-                )
-            elif 0.05 < diff_ratio <= 0.2:
-                trend = "increasing_mild"
-                emoji = "📈"
-                # EN: Slight increase — monitor spending
-                # VI: Tăng nhẹ — nên theo dõi để tránh vượt ngân sách
-                message = (
-                    f"{emoji} Spending in **{group.lower()}** is expected to increase slightly (**+{diff_ratio:.1%}**). "
-                    "Keep an eye on this category to ensure it stays within your limits."
-                )
-            elif -0.2 <= diff_ratio < -0.05:
-                trend = "decreasing_mild"
-                emoji = "📉"
-                # EN: Mild decrease — good progress
-                # VI: Giảm nhẹ — dấu hiệu tích cực, nên duy trì
-                message = (
-                    f"{emoji} Spending in **{group.lower()}** shows a moderate decrease (**{diff_ratio:.1%}**). "
-                    "Good progress — maintaining this trend can improve your savings rate."
-                )
-            elif diff_ratio < -0.2:
-                trend = "decreasing_strong"
-                emoji = "💪"
-                # EN: Strong decrease — excellent result
-                # VI: Giảm mạnh — kết quả rất tốt, người dùng kiểm soát chi tiêu hiệu quả
-                message = (
-                    f"{emoji} Excellent! Spending in **{group.lower()}** is projected to drop significantly (**{abs(diff_ratio):.1%}**). "
-                    "You're managing your budget efficiently — keep it up!"
-                )
-            else:
-                trend = "stable"
-                emoji = "⚖️"
-                # EN: Stable — consistent spending
-                # VI: Ổn định — chi tiêu đều đặn, tốt cho quản lý tài chính lâu dài
-                message = (
-                    f"{emoji} Spending in **{group.lower()}** is expected to remain stable, with no major fluctuations. "
-                    "Consistency is a key part of financial stability."
-                )
+        results = {}
+        if not monthly_sum.empty:
+            results = _forecast_by_user(monthly_sum, first_of_current_month.strftime('%Y-%m'), engine, executor)
 
-            results.append({
-                "group": group,
-                "predicted": round(predicted, 2),
-                "confidence": round(confidence, 2),
-                "trend": trend,
-                "emoji": emoji,
-                "message": message
-            })
-        return pd.DataFrame(results)
+        # Người dùng không có dữ liệu lịch sử
+        for user in users[known].unique():
+            if user not in results:
+                results[user] = [{"error": "Không có dữ liệu lịch sử (trước tháng này) để dự đoán."}]
+        return results
     except Exception as e:
-        return pd.DataFrame([{"error": str(e)}])
+        return {"error": str(e)}
     
-def suggest_expense_reduction(predicted_df, income, max_exceed_ratio=0.0):
+def _apply_ratios(predicted_df, ratios):
+    """
+    Ghi target / reduction_percent từ tỉ lệ giữ lại của từng nhóm
+    (None: không tìm được phương án trong ngân sách -> giữ nguyên dự đoán).
+    """
+    if ratios is None:
+        predicted_df["target"] = predicted_df["predicted"]
+        predicted_df["reduction_percent"] = 0.0
+        return
+
+    # Làm mượt: kéo tỉ lệ của từng nhóm về gần tỉ lệ trung bình
+    predicted_df["ratio"] = ratios * 0.7 + np.mean(ratios) * 0.3
+    predicted_df["target"] = (predicted_df["predicted"] * predicted_df["ratio"]).round(2)
+    predicted_df["reduction_percent"] = ((1 - predicted_df["ratio"]) * 100).round(2)
+
+
+SUGGESTION_MAP = {
+    "Necessary": "Giữ mức tối thiểu để không ảnh hưởng sinh hoạt",
+    "Other": "Giảm hợp lý, ưu tiên chi tiêu có kế hoạch",
+    "Unnecessary": "Ưu tiên cắt mạnh, tránh vượt ngân sách"
+}
+# Các cột không cần thiết cho JSON
+SUGGESTION_DROPPED = ("confidence", "message", "ratio")
+
+
+def _suggestion_summary(predicted_df, total_pred, income):
+    predicted_df["suggestion"] = predicted_df["group"].map(SUGGESTION_MAP)
+
+    total_target = predicted_df["target"].sum()
+    overshoot_percent = ((total_target - income) / income) * 100
+
+    result_df = predicted_df.drop(columns=list(SUGGESTION_DROPPED), errors='ignore')
+
+    return {
+        "suggestions": result_df.to_dict(orient="records"),
+        "total_predicted": round(total_pred, 2),
+        "total_target": round(total_target, 2),
+        "total_reduction": round(total_pred - total_target, 2),
+        "overshoot_percent_vs_income": round(overshoot_percent, 2),
+        "income": income
+    }
+
+
+def suggest_expense_reduction(predicted_df, income, max_exceed_ratio=0.0, solver="greedy"):
     """
     🔮 Đề xuất cắt giảm chi tiêu thông minh.
     Sửa đổi để trả về (return) một dictionary thay vì in ra.
+    solver: "greedy" (dạng đóng, mặc định) hoặc "linprog" (scipy, để đối chiếu).
     """
     try:
+        if solver not in SOLVERS:
+            raise ValueError(f"Unknown solver '{solver}'. Expected one of {', '.join(SOLVERS)}")
+
         total_pred = predicted_df["predicted"].sum()
         allowed_budget = income * (1 + max_exceed_ratio)
 
@@ -230,60 +693,252 @@ def suggest_expense_reduction(predicted_df, income, max_exceed_ratio=0.0):
             predicted_df["target"] = predicted_df["predicted"].round(2)
             predicted_df["reduction_percent"] = 0.0
         else:
-            preds = predicted_df["predicted"].values
-            groups = predicted_df["group"].values
-
-            weights = []
-            for g in groups:
-                weights.append(3 if g == "Necessary" else 2 if g == "Other" else 1)
-
-            c = [-w for w in weights]
-            A = [preds]
-            b = [allowed_budget]
-
-            bounds = []
-            for g in groups:
-                if g == "Necessary":
-                    bounds.append((0.75, 1.0))
-                elif g == "Other":
-                    bounds.append((0.6, 1.0))
+            preds = predicted_df["predicted"].to_numpy(dtype=float)
+            weights, lower = group_weights_and_bounds(predicted_df["group"].to_numpy())
+
+            with stage(f"allocate_{solver}"):
+                if solver == "linprog":
+                    ratios, success = linprog_ratios(preds, weights, lower, allowed_budget)
                 else:
-                    bounds.append((0.4, 1.0))
+                    ratios, success = greedy_ratios(preds, weights, lower, [allowed_budget])
+                    ratios, success = ratios[0], success[0]
+            _apply_ratios(predicted_df, ratios if success else None)
 
-            res = linprog(c, A_ub=A, b_ub=b, bounds=bounds, method="highs")
+        return _suggestion_summary(predicted_df, total_pred, income)
+    except Exception as e:
+        return {"error": str(e)}
 
-            if res.success:
-                predicted_df["ratio"] = res.x
-                mean_ratio = np.mean(res.x)
-                predicted_df["ratio"] = predicted_df["ratio"].apply(
-                    lambda r: (r * 0.7 + mean_ratio * 0.3)
-                )
-                predicted_df["target"] = (predicted_df["predicted"] * predicted_df["ratio"]).round(2)
-                predicted_df["reduction_percent"] = ((1 - predicted_df["ratio"]) * 100).round(2)
+
+def _valid_predictions(user_predictions):
+    return (
+        isinstance(user_predictions, list) and len(user_predictions) > 0
+        and all(isinstance(p, dict) and "predicted" in p and "group" in p for p in user_predictions)
+    )
+
+
+def suggest_expense_reduction_batch(predictions, incomes, max_exceed_ratio=0.0):
+    """
+    Đề xuất cho nhiều người dùng cùng lúc, cùng kết quả với suggest_expense_reduction.
+    Mọi dự đoán được trải phẳng thành mảng (một phần tử mỗi (user, nhóm)): phân bổ
+    (greedy_ratios trên ma trận user × nhóm), làm mượt, target và các tổng theo user
+    đều tính bằng phép toán mảng; chỉ còn bước dựng dict kết quả là vòng lặp Python.
+    predictions: {userId: [kết quả dự đoán theo nhóm]} (định dạng của /predict/batch).
+    incomes: {userId: thu nhập} hoặc một số dùng chung.
+    """
+    try:
+        results = {}
+        users = []
+        for user, user_predictions in predictions.items():
+            if _valid_predictions(user_predictions):
+                users.append(user)
             else:
-                predicted_df["target"] = predicted_df["predicted"]
-                predicted_df["reduction_percent"] = 0.0
-
-        suggestion_map = {
-            "Necessary": "Giữ mức tối thiểu để không ảnh hưởng sinh hoạt",
-            "Other": "Giảm hợp lý, ưu tiên chi tiêu có kế hoạch",
-            "Unnecessary": "Ưu tiên cắt mạnh, tránh vượt ngân sách"
-        }
-        predicted_df["suggestion"] = predicted_df["group"].map(suggestion_map)
-
-        total_target = predicted_df["target"].sum()
-        overshoot_percent = ((total_target - income) / income) * 100
-
-        # Chuyển các cột không cần thiết cho JSON
-        result_df = predicted_df.drop(columns=["confidence", "message", "ratio"], errors='ignore')
-
-        return {
-            "suggestions": result_df.to_dict(orient="records"),
-            "total_predicted": round(total_pred, 2),
-            "total_target": round(total_target, 2),
-            "total_reduction": round(total_pred - total_target, 2),
-            "overshoot_percent_vs_income": round(overshoot_percent, 2),
-            "income": income
-        }
+                results[user] = {"error": "Missing 'predicted' or 'group' in predictions"}
+
+        if users:
+            entries = [entry for user in users for entry in predictions[user]]
+            lengths = np.array([len(predictions[user]) for user in users])
+            owner = np.repeat(np.arange(len(users)), lengths)
+            position = np.arange(len(entries)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            values = [entry["predicted"] for entry in entries]
+            preds = np.array(values, dtype=float)
+            # Như cột "predicted" của DataFrame một user: toàn số nguyên -> int64, ngược lại float64
+            not_int = np.array([
+                not isinstance(value, (int, np.integer)) or isinstance(value, (bool, np.bool_)) for value in values
+            ])
+            int_users = np.bincount(owner, weights=not_int, minlength=len(users)) == 0
+            groups = np.array([entry["group"] for entry in entries], dtype=object)
+            user_incomes = [incomes[user] if isinstance(incomes, dict) else incomes for user in users]
+            budgets = np.array(user_incomes, dtype=float) * (1 + max_exceed_ratio)
+
+            # Ma trận (user × nhóm) cho bộ giải, ô đệm là NaN
+            matrix = np.full((len(users), lengths.max()), np.nan)
+            matrix[owner, position] = preds
+            weights, lower = group_weights_and_bounds(groups)
+            weight_matrix = np.ones_like(matrix)
+            lower_matrix = np.ones_like(matrix)
+            weight_matrix[owner, position] = weights
+            lower_matrix[owner, position] = lower
+            with stage("allocate_greedy"):
+                ratios, success = greedy_ratios(matrix, weight_matrix, lower_matrix, budgets)
+            ratios = ratios[owner, position]
+
+            totals = np.bincount(owner, weights=np.nan_to_num(preds), minlength=len(users))
+            reduced_users = (totals > budgets) & success
+            over = (totals > budgets)[owner]
+            reduced = reduced_users[owner]
+            # Làm mượt như _apply_ratios: kéo về tỉ lệ trung bình của chính user đó
+            mean_ratio = np.bincount(owner, weights=ratios, minlength=len(users)) / lengths
+            ratio = ratios * 0.7 + mean_ratio[owner] * 0.3
+            # Không tìm được phương án trong ngân sách -> giữ nguyên dự đoán
+            targets = np.where(reduced, np.round(preds * ratio, 2), np.where(over, preds, np.round(preds, 2)))
+            reductions = np.where(reduced, np.round((1 - ratio) * 100, 2), 0.0)
+
+            total_targets = np.bincount(owner, weights=np.nan_to_num(targets), minlength=len(users))
+            incomes_array = np.array(user_incomes, dtype=float)
+            overshoot = (total_targets - incomes_array) / incomes_array * 100
+
+            # Giữ kiểu như đường một user: user toàn số nguyên -> predicted / target không cắt giảm
+            # và các tổng là int; còn lại predicted là float
+            int_entries = int_users[owner]
+            predicted_values = preds.tolist()
+            target_values = targets.tolist()
+            for i in np.flatnonzero(int_entries).tolist():
+                predicted_values[i] = int(values[i])
+                if not reduced[i]:
+                    target_values[i] = predicted_values[i]
+            suggestions = [
+                {
+                    **{key: value for key, value in entry.items() if key not in SUGGESTION_DROPPED},
+                    "predicted": predicted,
+                    "target": target,
+                    "reduction_percent": reduction,
+                    "suggestion": SUGGESTION_MAP.get(entry["group"], np.nan),
+                }
+                for entry, predicted, target, reduction in zip(
+                    entries, predicted_values, target_values, reductions.tolist()
+                )
+            ]
+
+            total_values = np.round(totals, 2).tolist()
+            total_target_values = np.round(total_targets, 2).tolist()
+            reduction_values = np.round(totals - total_targets, 2).tolist()
+            for i in np.flatnonzero(int_users).tolist():
+                total_values[i] = int(totals[i])
+                if not reduced_users[i]:
+                    total_target_values[i] = int(total_targets[i])
+                    reduction_values[i] = total_values[i] - total_target_values[i]
+
+            offsets = np.cumsum(lengths) - lengths
+            for i, (user, start, length, percent) in enumerate(zip(
+                users, offsets.tolist(), lengths.tolist(), np.round(overshoot, 2).tolist(),
+            )):
+                results[user] = {
+                    "suggestions": suggestions[start:start + length],
+                    "total_predicted": total_values[i],
+                    "total_target": total_target_values[i],
+                    "total_reduction": reduction_values[i],
+                    "overshoot_percent_vs_income": percent,
+                    "income": user_incomes[i],
+                }
+
+        return {user: results[user] for user in predictions}
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+
+# 4️⃣ Insights: evaluate + predict + suggest trên cùng một lần parse
+def prepare_records(df, registry=None):
+    """
+    Parse ngày, phân loại nhóm và tính chỉ số tháng MỘT lần cho cả pipeline.
+    """
+    registry = registry or default_registry
+    with stage("parse_dates"):
+        dates = _parse_dates(df['date'])
+    with stage("classify"):
+        groups = registry.classify_series(df['category'])
+    return pd.DataFrame({
+        "date": dates,
+        "amount": df['amount'],
+        "category": df['category'],
+        "group": groups,
+        "month": _month_index(dates),
+    })
+
+
+def generate_insights(df, monthly_budget=2000, monthly_income=3000, prev_total_expenses=None,
+                      engine="forest", solver="greedy", registry=None, executor=None):
+    """
+    Đánh giá tháng trước, dự đoán tháng này và đề xuất cắt giảm trong một lần gọi,
+    dùng chung bảng records đã parse/phân loại/chia tháng.
+    prev_total_expenses = None -> lấy tổng chi của tháng liền trước tháng được đánh giá từ records.
+    """
+    registry = registry or default_registry
+    ROWS.inc(len(df), "generate_insights")
+    try:
+        prepared = prepare_records(df, registry)
+    except Exception as e:
+        return {"error": str(e)}
+
+    # 1. Evaluate
+    try:
+        if prev_total_expenses is None:
+            month_start = _last_month_start()
+            prev_key = month_start.year * 12 + month_start.month - 2
+            prev_total_expenses = prepared['amount'].to_numpy()[(prepared['month'] == prev_key).to_numpy()].sum()
+        evaluation = _evaluate_month(
+            prepared, prepared['date'], monthly_budget, monthly_income, prev_total_expenses, registry
+        )
+    except Exception as e:
+        evaluation = {"error": str(e)}
+
+    # 2. Predict
+    try:
+        first_of_current_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        historical = (prepared['date'] < first_of_current_month).to_numpy()
+        if not historical.any():
+            predictions = pd.DataFrame([{"error": "Không có dữ liệu lịch sử (trước tháng này) để dự đoán."}])
+        else:
+            predictions = _predict_grouped(
+                prepared['amount'].to_numpy(dtype=float)[historical],
+                prepared['group'].array[historical],
+                prepared['month'].to_numpy()[historical],
+                first_of_current_month, engine, executor
+            )
+    except Exception as e:
+        predictions = pd.DataFrame([{"error": str(e)}])
+
+    # 3. Suggest (trên kết quả dự đoán, không serialize lại)
+    if "predicted" in predictions.columns:
+        suggestion = suggest_expense_reduction(predictions.copy(), monthly_income, solver=solver)
+    else:
+        suggestion = {"error": "Không có dự đoán để đề xuất."}
+
+    return {
+        "evaluation": evaluation,
+        "predictions": predictions.to_dict(orient="records"),
+        "suggestion": suggestion,
+    }
+
+
+# 5️⃣ Nowcast: dự đoán tháng hiện tại cập nhật theo số đã chi từ đầu tháng
+def build_nowcast_state(df, monthly_budget=2000, engine="forest", registry=None, today=None):
+    """
+    Xử lý lịch sử MỘT lần để dựng NowcastState (xem nowcast.py): dự đoán theo nhóm,
+    phân bố chi tiêu trong tháng từ các tháng trước và số đã chi của tháng hiện tại.
+    df phải là records từng giao dịch (MonthlyTotalsError nếu đã gộp theo tháng).
+    """
+    registry = registry or default_registry
+    ROWS.inc(len(df), "build_nowcast_state")
+    today = today or datetime.now()
+    first_of_current_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    current_month = today.year * 12 + today.month - 1
+
+    prepared = prepare_records(df, registry)
+    check_transaction_level(prepared['date'])
+    months = prepared['month'].to_numpy()
+    historical = months < current_month
+    if not historical.any():
+        raise ValueError("Không có dữ liệu lịch sử (trước tháng này) để dự đoán.")
+
+    amounts = prepared['amount'].to_numpy(dtype=float)
+    amounts = np.where(np.isnan(amounts), 0.0, amounts)
+    groups = prepared['group'].array
+    codes = np.asarray(groups.codes, dtype=np.int64)
+
+    predictions = _predict_grouped(
+        amounts[historical], groups[historical], months[historical], first_of_current_month, engine
+    )
+    if "error" in predictions.columns:
+        raise ValueError(predictions["error"].iloc[0])
+    predictions = predictions.set_index("group").reindex(list(GROUPS))
+    forecast = predictions["predicted"].fillna(0.0).to_numpy(dtype=float)
+    sigma = predictions["confidence"].fillna(0.0).to_numpy(dtype=float) / 1.96
+
+    with stage("nowcast_profile"):
+        dates = prepared['date']
+        positions = month_position(dates.dt.day.to_numpy(), dates.dt.days_in_month.to_numpy())
+        profile = spend_profile(codes[historical], positions[historical], amounts[historical], len(GROUPS))
+
+    current = months == current_month
+    month_to_date = np.bincount(codes[current], weights=amounts[current], minlength=len(GROUPS))
+    return NowcastState(current_month, forecast, sigma, profile, month_to_date, monthly_budget, registry)
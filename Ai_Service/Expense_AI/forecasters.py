@@ -0,0 +1,377 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import MODEL_FITS, MODEL_FIT_SECONDS
+
+# Các engine dự đoán có thể chọn qua tham số `engine`
+ENGINES = ("forest", "linear", "ewma", "seasonal_naive", "online")
+# Các engine nhận cả ma trận nhóm × tháng trong một lần gọi (forecast_matrix)
+VECTORIZED_ENGINES = ("linear", "ewma", "seasonal_naive", "online")
+
+
+# -----------------------------------
+# 🌲 RandomForest (mỗi chuỗi một model)
+# -----------------------------------
+def fit_forest(month_idx, amounts):
+    """
+    Huấn luyện RandomForest trên một chuỗi tổng theo tháng.
+    Trả về (predicted, std) cho tháng ngay sau tháng cuối cùng có dữ liệu.
+    """
+    # sklearn chỉ import khi thật sự huấn luyện (hoặc khi prewarm) để service khởi động nhanh
+    from sklearn.ensemble import RandomForestRegressor
+
+    X = (month_idx - month_idx.min()).reshape(-1, 1)
+    model = RandomForestRegressor(n_estimators=100, random_state=42)
+    with MODEL_FIT_SECONDS.time("forest"):
+        model.fit(X, amounts)
+
+    next_month_num = X[-1, 0] + 1
+    predicted = model.predict([[next_month_num]])[0]
+    residuals = amounts - model.predict(X)
+    return predicted, np.std(residuals)
+
+
+def _fit_forest_task(task):
+    return fit_forest(*task)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_forest_executor():
+    """
+    Executor dùng chung để huấn luyện forest song song, cấu hình qua biến môi trường:
+    FOREST_EXECUTOR = "serial" (mặc định) | "thread" | "process", FOREST_WORKERS = số worker.
+    """
+    global _executor
+    kind = os.environ.get("FOREST_EXECUTOR", "serial")
+    if kind == "serial":
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = int(os.environ.get("FOREST_WORKERS", os.cpu_count() or 1))
+                if kind == "thread":
+                    _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="forest")
+                elif kind == "process":
+                    _executor = ProcessPoolExecutor(max_workers=workers)
+                else:
+                    raise ValueError(f"Unknown FOREST_EXECUTOR '{kind}'")
+    return _executor
+
+
+def fit_forests(tasks, executor=None):
+    """
+    Huấn luyện nhiều forest (mỗi task là (month_idx, amounts)), giữ nguyên thứ tự kết quả.
+    Mỗi model dùng random_state cố định nên kết quả song song trùng khớp từng bit với tuần tự.
+    """
+    executor = executor or get_forest_executor()
+    # Đếm ở tiến trình gọi: thời gian fit trong worker process không về được đây
+    MODEL_FITS.inc(len(tasks), "forest")
+    if executor is None or len(tasks) < 2:
+        return [fit_forest(*task) for task in tasks]
+    return list(executor.map(_fit_forest_task, tasks))
+
+
+# -----------------------------------
+# 🧮 Tiện ích trên ma trận tháng × nhóm
+# -----------------------------------
+def _last_present(mask):
+    """
+    Vị trí cột cuối cùng có dữ liệu của mỗi dòng (-1 nếu dòng rỗng).
+    """
+    positions = np.where(mask, np.arange(mask.shape[1]), -1)
+    return positions.max(axis=1)
+
+
+def _forward_fill(Y, mask):
+    """
+    Điền giá trị gần nhất phía trước cho các ô thiếu (NaN) theo từng dòng.
+    """
+    idx = np.where(mask, np.arange(Y.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return np.take_along_axis(Y, idx, axis=1)
+
+
+# -----------------------------------
+# 📈 Linear trend (least squares đóng)
+# -----------------------------------
+def forecast_linear(Y):
+    """
+    Hồi quy tuyến tính y = a + b*t cho tất cả các dòng cùng lúc (chỉ các ô có dữ liệu).
+    Trả về (predicted, std) cho tháng ngay sau tháng cuối cùng có dữ liệu.
+    """
+    mask = ~np.isnan(Y)
+    w = mask.astype(float)
+    y = np.where(mask, Y, 0.0)
+    t = np.arange(Y.shape[1], dtype=float)
+
+    sw = w.sum(axis=1)
+    st = w @ t
+    stt = w @ (t * t)
+    sy = y.sum(axis=1)
+    sty = y @ t
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = sw * stt - st * st
+        slope = np.where(denom > 0, (sw * sty - st * sy) / denom, 0.0)
+        intercept = np.where(sw > 0, (sy - slope * st) / sw, 0.0)
+
+        fitted = intercept[:, None] + slope[:, None] * t
+        residuals = np.where(mask, Y - fitted, 0.0)
+        std = np.sqrt(np.where(sw > 0, (residuals ** 2).sum(axis=1) / sw, 0.0))
+
+    next_t = _last_present(mask) + 1
+    predicted = np.maximum(intercept + slope * next_t, 0.0)
+    return predicted, std
+
+
+# -----------------------------------
+# 🌊 Exponentially weighted moving average
+# -----------------------------------
+def forecast_ewma(Y, alpha=0.5):
+    """
+    Làm trơn hàm mũ (EWMA) trên các tháng có dữ liệu, tính đồng thời cho mọi dòng.
+    std là độ lệch của sai số dự đoán một bước.
+    """
+    mask = ~np.isnan(Y)
+    n_rows = Y.shape[0]
+    level = np.zeros(n_rows)
+    started = np.zeros(n_rows, dtype=bool)
+    sse = np.zeros(n_rows)
+    n_err = np.zeros(n_rows)
+
+    for col in range(Y.shape[1]):
+        present = mask[:, col]
+        y = np.where(present, Y[:, col], 0.0)
+        update = present & started
+        err = y - level
+        sse += np.where(update, err * err, 0.0)
+        n_err += update
+        level = np.where(update, level + alpha * err, np.where(present & ~started, y, level))
+        started |= present
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = np.sqrt(np.where(n_err > 0, sse / n_err, 0.0))
+    return level, std
+
+
+# -----------------------------------
+# 📅 Seasonal naive (cùng tháng năm trước)
+# -----------------------------------
+def forecast_seasonal_naive(Y, season=12):
+    """
+    Dự đoán bằng giá trị cùng kỳ năm trước; nếu không có thì dùng tháng có dữ liệu gần nhất.
+    std là RMS của sai số theo mùa (hoặc sai số lag-1 khi lịch sử ngắn hơn một mùa).
+    """
+    mask = ~np.isnan(Y)
+    n_rows, n_cols = Y.shape
+    rows = np.arange(n_rows)
+    last = _last_present(mask)
+    filled = _forward_fill(Y, mask)
+
+    seasonal_col = last + 1 - season
+    has_seasonal = seasonal_col >= 0
+    seasonal_col = np.clip(seasonal_col, 0, None)
+    has_seasonal &= mask[rows, seasonal_col]
+    predicted = np.where(has_seasonal, Y[rows, seasonal_col], filled[rows, last])
+
+    with np.errstate(invalid="ignore"):
+        if n_cols > season:
+            seasonal_err = Y[:, season:] - Y[:, :-season]
+            seasonal_ok = mask[:, season:] & mask[:, :-season]
+        else:
+            seasonal_err = np.zeros((n_rows, 0))
+            seasonal_ok = np.zeros((n_rows, 0), dtype=bool)
+        s_sse = np.where(seasonal_ok, seasonal_err, 0.0) ** 2
+        s_n = seasonal_ok.sum(axis=1)
+
+        lag_err = Y[:, 1:] - filled[:, :-1]
+        lag_ok = mask[:, 1:] & (np.maximum.accumulate(mask, axis=1)[:, :-1])
+        l_sse = np.where(lag_ok, lag_err, 0.0) ** 2
+        l_n = lag_ok.sum(axis=1)
+
+        std = np.where(
+            s_n > 0,
+            np.sqrt(s_sse.sum(axis=1) / np.maximum(s_n, 1)),
+            np.sqrt(l_sse.sum(axis=1) / np.maximum(l_n, 1)),
+        )
+    return predicted, std
+
+
+# -----------------------------------
+# 🔁 Online (Holt-Winters cộng tính, cập nhật từng tháng / từng giao dịch)
+# -----------------------------------
+class OnlineForecaster:
+    """
+    Trạng thái dự đoán của một chuỗi tổng theo tháng, cập nhật O(1):
+    level / trend làm trơn hàm mũ, chỉ số mùa 12 tháng (chỉ học sau khi đủ một năm)
+    và tổng bình phương sai số dự đoán một bước.
+    Giao dịch được cộng vào tháng đang mở (add); tháng đóng lại khi có giao dịch của
+    tháng sau hoặc khi gọi advance(). Trạng thái serialize được qua to_dict / from_dict.
+    """
+
+    __slots__ = (
+        "alpha", "beta", "gamma", "level", "trend", "seasonal", "sse", "n_errors",
+        "count", "total", "last_month", "last_value", "open_month", "open_total",
+    )
+    SEASON = 12
+
+    def __init__(self, alpha=0.5, beta=0.1, gamma=0.1):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.level = 0.0
+        self.trend = 0.0
+        self.seasonal = [0.0] * self.SEASON
+        self.sse = 0.0
+        self.n_errors = 0
+        self.count = 0
+        self.total = 0.0
+        self.last_month = None
+        self.last_value = 0.0
+        self.open_month = None
+        self.open_total = 0.0
+
+    def observe(self, month, value):
+        """
+        Cập nhật với tổng của một tháng đã kết thúc (month tăng dần, có thể cách quãng).
+        """
+        season = month % self.SEASON
+        if self.count == 0:
+            self.level = value
+        else:
+            gap = month - self.last_month
+            error = value - (self.level + gap * self.trend + self.seasonal[season])
+            self.sse += error * error
+            self.n_errors += 1
+            if self.count == 1:
+                self.trend = (value - self.level) / gap
+                level = value
+            else:
+                level = self.alpha * (value - self.seasonal[season]) + (1 - self.alpha) * (self.level + gap * self.trend)
+                self.trend = self.beta * (level - self.level) / gap + (1 - self.beta) * self.trend
+            if self.count >= self.SEASON:
+                self.seasonal[season] = self.gamma * (value - level) + (1 - self.gamma) * self.seasonal[season]
+            self.level = level
+        self.count += 1
+        self.total += value
+        self.last_month = month
+        self.last_value = value
+
+    def add(self, month, amount):
+        """
+        Cộng một giao dịch. Trả về False nếu giao dịch thuộc tháng đã đóng (cần dựng lại).
+        """
+        if self.open_month is not None and month < self.open_month:
+            return False
+        if self.open_month is None and self.last_month is not None and month <= self.last_month:
+            return False
+        self.advance(month)
+        if self.open_month is None:
+            self.open_month, self.open_total = month, 0.0
+        self.open_total += amount
+        return True
+
+    def advance(self, month):
+        """
+        Đóng tháng đang mở nếu nó đứng trước month.
+        """
+        if self.open_month is not None and self.open_month < month:
+            self.observe(self.open_month, self.open_total)
+            self.open_month, self.open_total = None, 0.0
+
+    def predict(self):
+        """
+        (predicted, std) cho tháng ngay sau tháng đã đóng cuối cùng.
+        """
+        if self.count == 0:
+            return 0.0, 0.0
+        month = self.last_month + 1
+        predicted = max(self.level + self.trend + self.seasonal[month % self.SEASON], 0.0)
+        std = (self.sse / self.n_errors) ** 0.5 if self.n_errors else 0.0
+        return predicted, std
+
+    def to_dict(self):
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state["seasonal"] = list(self.seasonal)
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        forecaster = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(forecaster, name, state[name])
+        return forecaster
+
+
+def forecast_online(Y, alpha=0.5, beta=0.1, gamma=0.1):
+    """
+    Cùng phép cập nhật với OnlineForecaster.observe, chạy đồng thời cho mọi dòng
+    (vòng lặp theo tháng như forecast_ewma, bỏ qua ô NaN); cùng kết quả với trạng thái
+    được cập nhật dần từ các tổng tháng đó.
+    """
+    season_length = OnlineForecaster.SEASON
+    mask = ~np.isnan(Y)
+    n_rows = Y.shape[0]
+    level = np.zeros(n_rows)
+    trend = np.zeros(n_rows)
+    seasonal = np.zeros((n_rows, season_length))
+    sse = np.zeros(n_rows)
+    n_err = np.zeros(n_rows)
+    count = np.zeros(n_rows, dtype=np.int64)
+    last_month = np.zeros(n_rows, dtype=np.int64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for col in range(Y.shape[1]):
+            present = mask[:, col]
+            y = np.where(present, Y[:, col], 0.0)
+            season = col % season_length
+            update = present & (count > 0)
+            gap = col - last_month
+
+            error = y - (level + gap * trend + seasonal[:, season])
+            sse += np.where(update, error * error, 0.0)
+            n_err += update
+            smoothed = alpha * (y - seasonal[:, season]) + (1 - alpha) * (level + gap * trend)
+            new_level = np.where(update & (count >= 2), smoothed, y)
+            trend = np.where(
+                update & (count == 1), (y - level) / gap,
+                np.where(update, beta * (new_level - level) / gap + (1 - beta) * trend, trend),
+            )
+            refit = update & (count >= season_length)
+            seasonal[:, season] = np.where(
+                refit, gamma * (y - new_level) + (1 - gamma) * seasonal[:, season], seasonal[:, season]
+            )
+            level = np.where(present, new_level, level)
+            count += present
+            last_month = np.where(present, col, last_month)
+
+        next_season = (last_month + 1) % season_length
+        predicted = np.where(
+            count > 0, np.maximum(level + trend + seasonal[np.arange(n_rows), next_season], 0.0), 0.0
+        )
+        std = np.where(n_err > 0, np.sqrt(sse / n_err), 0.0)
+    return predicted, std
+
+
+def forecast_matrix(Y, engine):
+    """
+    Dự đoán tháng kế tiếp cho mọi dòng của ma trận nhóm × tháng (NaN = tháng không có chi tiêu).
+    Các cột phải là các tháng liên tiếp.
+    """
+    forecasters = {
+        "linear": forecast_linear,
+        "ewma": forecast_ewma,
+        "seasonal_naive": forecast_seasonal_naive,
+        "online": forecast_online,
+    }
+    if engine not in forecasters:
+        raise ValueError(f"Unknown vectorized engine '{engine}'")
+    MODEL_FITS.inc(len(Y), engine)
+    with MODEL_FIT_SECONDS.time(engine):
+        return forecasters[engine](Y)
@@ -0,0 +1,330 @@
+import pandas as pd
+
+from aggregate_store import get_store
+from categories import resolve_registry
+from expenses_model import (
+    build_nowcast_state,
+    evaluate_expenses,
+    evaluate_expenses_range,
+    generate_insights,
+    predict_next_month_by_group,
+    predict_next_month_hierarchical,
+    predict_next_month_batch,
+    predict_from_online_states,
+    suggest_expense_reduction,
+    suggest_expense_reduction_batch,
+)
+from allocator import SOLVERS
+from anomalies import detect_anomalies, detect_anomalies_batch
+from forecasters import ENGINES, VECTORIZED_ENGINES
+import nowcast
+import online
+import precompute
+
+# Xử lý request độc lập với web framework: nhận dict tham số đã giải mã,
+# trả về (kết quả, HTTP status). Dùng chung cho Flask (app.py) và ASGI (asgi.py).
+
+
+def load_records(data):
+    """
+    Lấy DataFrame records từ body, hoặc đọc bảng tổng theo tháng trong kho
+    khi request chỉ gửi 'userId' (đã đồng bộ qua /ingest).
+    """
+    if 'records' in data:
+        return pd.DataFrame(data['records'])
+    if 'userId' in data:
+        return get_store().records_frame([data['userId']]).drop(columns=['userId'])
+    return None
+
+
+def _precomputed(data, engine, budget=None, income=None):
+    """
+    Kết quả /insights đã tính trước (precompute.py) cho request chỉ gửi 'userId'
+    với tham số mặc định của nhóm category, None nếu không dùng được.
+    """
+    if 'records' in data or 'userId' not in data or data.get('category_groups'):
+        return None
+    return precompute.lookup(str(data['userId']), engine, budget, income)
+
+
+def _registry(data):
+    """
+    Bảng tra category của request, hoặc lỗi 400 khi 'category_groups' sai định dạng.
+    """
+    try:
+        return resolve_registry(data.get('category_groups')), None
+    except ValueError as e:
+        return None, ({"error": f"Invalid 'category_groups': {e}"}, 400)
+
+
+def _invalid_engine(engine):
+    if engine not in ENGINES:
+        return {"error": f"Invalid 'engine', expected one of {list(ENGINES)}"}, 400
+    return None
+
+
+def handle_evaluate(data):
+    df = load_records(data) if data else None
+    if df is None:
+        return {"error": "Missing 'records' or 'userId' field"}, 400
+
+    budget = data.get('budget', 2000)
+    income = data.get('income', 3000)
+    prev_expenses = data.get('prev_expenses', 1800)
+
+    # Cập nhật lời gọi hàm, bỏ 'month_year'
+    registry, invalid = _registry(data)
+    if invalid:
+        return invalid
+    return evaluate_expenses(df, budget, income, prev_expenses, registry=registry), 200
+
+
+def handle_evaluate_range(data):
+    df = load_records(data) if data else None
+    if df is None:
+        return {"error": "Missing 'records' or 'userId' field"}, 400
+
+    budget = data.get('budget', 2000)
+    income = data.get('income', 3000)
+
+    # Mỗi tháng trong khoảng [from, to] ('YYYY-MM') được đánh giá, xu hướng so với tháng trước đó
+    registry, invalid = _registry(data)
+    if invalid:
+        return invalid
+    return evaluate_expenses_range(df, data.get('from'), data.get('to'), budget, income, registry=registry), 200
+
+
+def handle_predict(data):
+    # Chỉ đọc records sau khi biết không có kết quả tính trước dùng được
+    if not data or ('records' not in data and 'userId' not in data):
+        return {"error": "Missing 'records' or 'userId' field"}, 400
+
+    registry, invalid = _registry(data)
+    if invalid:
+        return invalid
+
+    # hierarchical: dự đoán từng category rồi cộng dồn lên nhóm (chỉ engine vector hoá)
+    if data.get('hierarchical'):
+        engine = data.get('engine', 'linear')
+        if engine not in VECTORIZED_ENGINES:
+            return {"error": f"Hierarchical mode requires 'engine' in {list(VECTORIZED_ENGINES)}"}, 400
+        return predict_next_month_hierarchical(load_records(data), engine=engine, registry=registry), 200
+
+    engine = data.get('engine', 'forest')
+    invalid = _invalid_engine(engine)
+    if invalid:
+        return invalid
+
+    cached = _precomputed(data, engine)
+    if cached is not None and isinstance(cached.get("predictions"), list):
+        return pd.DataFrame(cached["predictions"]), 200
+    # Engine online cho user trong kho: đọc trạng thái đã cập nhật dần, không huấn luyện lại
+    if engine == 'online' and 'records' not in data and not data.get('category_groups'):
+        return predict_from_online_states(online.user_states(data['userId'])), 200
+    return predict_next_month_by_group(load_records(data), engine=engine, registry=registry), 200
+
+
+def handle_predict_batch(data):
+    if not data or ('records' not in data and 'userIds' not in data):
+        return {"error": "Missing 'records' or 'userIds' field"}, 400
+
+    # Mỗi record phải có 'userId' để tách kết quả theo người dùng
+    if 'records' in data:
+        df = pd.DataFrame(data['records'])
+    elif not isinstance(data['userIds'], list):
+        return {"error": "'userIds' must be a list"}, 400
+    else:
+        df = get_store().records_frame(data['userIds'])
+    if 'userId' not in df.columns:
+        return {"error": "Missing 'userId' in records"}, 400
+
+    engine = data.get('engine', 'forest')
+    invalid = _invalid_engine(engine)
+    if invalid:
+        return invalid
+
+    registry, invalid = _registry(data)
+    if invalid:
+        return invalid
+    return predict_next_month_batch(df, engine=engine, registry=registry), 200
+
+
+def handle_suggest(data):
+    if not data or 'predictions' not in data or 'income' not in data:
+        return {"error": "Missing 'predictions' or 'income' field"}, 400
+
+    try:
+        # 1. Lấy dữ liệu dự đoán (từ /predict)
+        predictions_list = data['predictions']
+        predicted_df = pd.DataFrame(predictions_list)
+        
+        # 2. Lấy thu nhập
+        income = data.get('income')
+
+        solver = data.get('solver', 'greedy')
+        if solver not in SOLVERS:
+            return {"error": f"Invalid 'solver', expected one of {list(SOLVERS)}"}, 400
+
+        # 3. Gọi hàm đề xuất
+        return suggest_expense_reduction(predicted_df, income, solver=solver), 200
+        
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+
+def handle_suggest_batch(data):
+    # predictions: {userId: [...]} (kết quả của /predict/batch); income: {userId: số} hoặc một số chung
+    if not data or 'predictions' not in data or 'income' not in data:
+        return {"error": "Missing 'predictions' or 'income' field"}, 400
+    if not isinstance(data['predictions'], dict):
+        return {"error": "'predictions' must map userId to a list of group predictions"}, 400
+    if isinstance(data['income'], dict) and set(data['predictions']) - set(data['income']):
+        return {"error": "Missing 'income' for some users"}, 400
+
+    return suggest_expense_reduction_batch(data['predictions'], data['income']), 200
+
+
+def handle_insights(data):
+    # Chỉ đọc records sau khi biết không có kết quả tính trước dùng được
+    if not data or ('records' not in data and 'userId' not in data):
+        return {"error": "Missing 'records' or 'userId' field"}, 400
+
+    budget = data.get('budget', 2000)
+    income = data.get('income', 3000)
+    # Không gửi prev_expenses -> lấy tổng chi của tháng liền trước từ chính records
+    prev_expenses = data.get('prev_expenses')
+
+    engine = data.get('engine', 'forest')
+    invalid = _invalid_engine(engine)
+    if invalid:
+        return invalid
+    solver = data.get('solver', 'greedy')
+    if solver not in SOLVERS:
+        return {"error": f"Invalid 'solver', expected one of {list(SOLVERS)}"}, 400
+
+    if prev_expenses is None and solver == 'greedy':
+        cached = _precomputed(data, engine, budget, income)
+        if cached is not None:
+            return cached, 200
+
+    registry, invalid = _registry(data)
+    if invalid:
+        return invalid
+    result = generate_insights(
+        load_records(data), budget, income, prev_expenses, engine=engine, solver=solver, registry=registry
+    )
+    return result, (500 if "error" in result else 200)
+
+
+def handle_nowcast(data):
+    """
+    Dựng trạng thái nowcast từ records từng giao dịch và trả về ước tính cuối tháng hiện tại.
+    Có 'userId' -> giữ trạng thái để /nowcast/update cập nhật từng giao dịch mới.
+    Kho (aggregate_store) chỉ giữ tổng theo tháng nên không dùng được ở đây.
+    """
+    if not data or 'records' not in data:
+        return {"error": "Missing 'records' field (nowcast needs transaction-level records)"}, 400
+
+    engine = data.get('engine', 'forest')
+    invalid = _invalid_engine(engine)
+    if invalid:
+        return invalid
+
+    registry, invalid = _registry(data)
+    if invalid:
+        return invalid
+    try:
+        state = build_nowcast_state(pd.DataFrame(data['records']), data.get('budget', 2000), engine, registry)
+    except nowcast.MonthlyTotalsError as e:
+        return {"error": str(e)}, 400
+    except Exception as e:
+        return {"error": str(e)}, 500
+    if 'userId' in data:
+        nowcast.remember(data['userId'], state)
+    return state.project(), 200
+
+
+def handle_nowcast_update(data):
+    """
+    Cộng các giao dịch mới vào trạng thái nowcast của user (O(1) mỗi giao dịch,
+    không xử lý lại lịch sử, tất cả hoặc không) và trả về ước tính mới.
+    """
+    if not data or 'userId' not in data or not isinstance(data.get('transactions'), list):
+        return {"error": "Missing 'userId' or 'transactions' field"}, 400
+
+    state = nowcast.get_state(data['userId'])
+    if state is None:
+        return {"error": "No nowcast state for this user, call /nowcast first"}, 404
+
+    try:
+        # Cả lô được kiểm tra trước khi cộng: lỗi ở một giao dịch thì không giao dịch nào được tính
+        if not state.add_many(data['transactions']):
+            nowcast.forget(data['userId'])
+            return {"error": "Nowcast state is outdated (new month), call /nowcast again"}, 409
+        return state.project(budget=data.get('budget')), 200
+    except (KeyError, TypeError, ValueError) as e:
+        return {"error": f"Invalid transaction: {e}"}, 400
+
+
+def _anomaly_params(data):
+    """
+    (threshold, window, min_history) từ request, hoặc lỗi 400.
+    """
+    try:
+        threshold = float(data.get('threshold', 3.5))
+        window = int(data.get('window', 6))
+        min_history = int(data.get('min_history', 3))
+    except (TypeError, ValueError):
+        return None, ({"error": "'threshold', 'window' and 'min_history' must be numbers"}, 400)
+    if threshold <= 0 or window < 1 or not 1 <= min_history <= window:
+        return None, ({"error": "Expected threshold > 0, window >= 1 and 1 <= min_history <= window"}, 400)
+    return (threshold, window, min_history), None
+
+
+def handle_anomalies(data):
+    if not data or 'records' not in data:
+        return {"error": "Missing 'records' field"}, 400
+    params, invalid = _anomaly_params(data)
+    if invalid:
+        return invalid
+
+    registry, invalid = _registry(data)
+    if invalid:
+        return invalid
+    result = detect_anomalies(pd.DataFrame(data['records']), *params, registry=registry)
+    return result, (500 if "error" in result else 200)
+
+
+def handle_anomalies_batch(data):
+    if not data or 'records' not in data:
+        return {"error": "Missing 'records' field"}, 400
+    df = pd.DataFrame(data['records'])
+    if 'userId' not in df.columns:
+        return {"error": "Missing 'userId' in records"}, 400
+    params, invalid = _anomaly_params(data)
+    if invalid:
+        return invalid
+
+    registry, invalid = _registry(data)
+    if invalid:
+        return invalid
+    result = detect_anomalies_batch(df, "userId", *params, registry=registry)
+    return result, (500 if "error" in result else 200)
+
+
+# Các endpoint cần records từng giao dịch (ngày trong tháng, số tiền từng lần chi).
+# Body NDJSON bị gộp thành tổng theo tháng (streaming.py) nên bị từ chối ở đây.
+TRANSACTION_LEVEL_ROUTES = frozenset({'/nowcast', '/anomalies', '/anomalies/batch'})
+
+# Các endpoint tính toán nặng (CPU-bound): ASGI chuyển sang process pool
+COMPUTE_HANDLERS = {
+    '/evaluate': handle_evaluate,
+    '/evaluate/range': handle_evaluate_range,
+    '/predict': handle_predict,
+    '/predict/batch': handle_predict_batch,
+    '/suggest': handle_suggest,
+    '/suggest/batch': handle_suggest_batch,
+    '/insights': handle_insights,
+    '/anomalies': handle_anomalies,
+    '/anomalies/batch': handle_anomalies_batch,
+}
@@ -0,0 +1,233 @@
+"""
+Đo đạc nội bộ của AI service, xuất ra /metrics theo định dạng text của Prometheus.
+
+Không phụ thuộc prometheus_client: mỗi lần ghi chỉ là một phép cộng dưới lock
+nên có thể bật thường trực trong production.
+"""
+import bisect
+import threading
+import time
+
+# Mốc histogram (giây) cho cả request lẫn từng bước xử lý
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# -----------------------------------
+# 📊 Các loại metric
+# -----------------------------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for labels, value in values.items():
+                self._values[labels] = self._values.get(labels, 0) + value
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [số quan sát theo từng bucket (không cộng dồn) + bucket +Inf, tổng]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *labels):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += seconds
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for labels, (counts, total) in values.items():
+                state = self._values.get(labels)
+                if state is None:
+                    state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = (("le", _format_value(float(bound))),)
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, labels, le), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, labels), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, labels), cumulative
+
+
+class Gauge:
+    """
+    Giá trị đọc tại thời điểm scrape qua callback (vd. thống kê cache).
+    kind="counter" cho giá trị chỉ tăng được đếm ở nơi khác.
+    """
+
+    def __init__(self, name, documentation, callback, kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.kind = kind
+
+    def drain(self):
+        return {}
+
+    def merge(self, values):
+        pass
+
+    def samples(self):
+        yield self.name, "", self.callback()
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+# -----------------------------------
+# 🗂️ Registry
+# -----------------------------------
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback, kind="gauge"):
+        return self.register(Gauge(name, documentation, callback, kind))
+
+    def drain(self):
+        """
+        Lấy và xoá số liệu đã ghi (dùng trong worker process để gửi về tiến trình chính).
+        """
+        return {name: metric.drain() for name, metric in self._metrics.items()}
+
+    def merge(self, state):
+        for name, values in state.items():
+            if values and name in self._metrics:
+                self._metrics[name].merge(values)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUESTS = REGISTRY.counter(
+    "expense_ai_requests_total", "HTTP requests by endpoint and status", ("endpoint", "status")
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "expense_ai_request_duration_seconds", "End-to-end request latency", ("endpoint",)
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "expense_ai_stage_duration_seconds", "Latency of internal processing stages", ("stage",)
+)
+ROWS = REGISTRY.counter(
+    "expense_ai_rows_processed_total", "Expense records processed by model function", ("function",)
+)
+MODEL_FITS = REGISTRY.counter(
+    "expense_ai_model_fits_total", "Forecast series fitted", ("engine",)
+)
+MODEL_FIT_SECONDS = REGISTRY.histogram(
+    "expense_ai_model_fit_duration_seconds",
+    "Model fit latency (one forest, or one vectorized call over all series)", ("engine",)
+)
+ERRORS = REGISTRY.counter(
+    "expense_ai_errors_total", "Requests that returned an error", ("endpoint", "kind")
+)
+
+
+def stage(name):
+    """
+    with stage("parse_dates"): ...  -> ghi thời gian vào expense_ai_stage_duration_seconds.
+    """
+    return _Timer(STAGE_SECONDS, (name,))
+
+
+def observe_request(endpoint, status, seconds, result=None):
+    REQUESTS.inc(1, endpoint, str(status))
+    REQUEST_SECONDS.observe(seconds, endpoint)
+    if status >= 400:
+        ERRORS.inc(1, endpoint, "http")
+    elif result is not None and "error" in getattr(result, "columns", result):
+        ERRORS.inc(1, endpoint, "result")
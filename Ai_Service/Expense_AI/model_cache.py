@@ -0,0 +1,185 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from metrics import REGISTRY
+
+
+# -----------------------------------
+# 🗃️ LRU + TTL cache cho kết quả dự đoán đã huấn luyện
+# -----------------------------------
+class ModelCache:
+    """
+    Cache LRU có TTL và giới hạn bộ nhớ (ước lượng) cho kết quả của các forecaster.
+    Khóa là fingerprint của tổng chi tiêu theo tháng của người dùng.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=3600, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.environ.get("MODEL_CACHE_MAX_ENTRIES", 10000)),
+            ttl_seconds=float(os.environ.get("MODEL_CACHE_TTL_SECONDS", 3600)),
+            max_bytes=int(os.environ.get("MODEL_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        )
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_many(self, keys):
+        """
+        get() cho nhiều khóa với một lần khóa lock; trả về list giá trị (None nếu không có).
+        """
+        if not self.enabled:
+            return [None] * len(keys)
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[2] < now:
+                    self._remove(key)
+                    self.evictions += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    values.append(entry[0])
+        return values
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        size = _approx_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl_seconds)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+def _approx_size(obj):
+    """
+    Ước lượng kích thước (bytes) của kết quả: list/tuple/dict lồng nhau với giá trị vô hướng.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_approx_size(k) + _approx_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_approx_size(v) for v in obj)
+    return size
+
+
+def row_hashes(monthly_sum):
+    """
+    Hash 64-bit cho từng dòng (group, month, amount) của chuỗi tổng theo tháng.
+    """
+    return pd.util.hash_pandas_object(monthly_sum, index=True).to_numpy()
+
+
+def _mix64(x, seed):
+    """
+    splitmix64: trộn từng hash 64-bit với seed (phép toán uint64, tràn số là có chủ ý).
+    """
+    z = x + np.uint64(seed)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def group_fingerprints(hashes, starts, current_month, engine):
+    """
+    Fingerprint 128-bit cho từng đoạn liên tiếp hashes[starts[i]:starts[i + 1]] (lịch sử tổng
+    theo tháng của một người dùng) + tháng hiện tại + engine, tính trong một lượt cho mọi đoạn:
+    tổng (mod 2^64) của hash từng dòng sau khi trộn với hai seed khác nhau, kèm số dòng.
+    Trả về list khóa bytes, cùng thứ tự với starts.
+    """
+    seed = hashlib.blake2b(f"{current_month}|{engine}".encode(), digest_size=16).digest()
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    counts = np.diff(np.r_[starts, len(hashes)]).astype(np.uint64)
+    keys = np.column_stack([
+        np.add.reduceat(_mix64(hashes, int.from_bytes(seed[:8], "little")), starts),
+        np.add.reduceat(_mix64(hashes, int.from_bytes(seed[8:], "little")), starts),
+        counts,
+    ])
+    return np.ascontiguousarray(keys).view("V24").ravel().tolist()
+
+
+# Cache dùng chung trong tiến trình, cấu hình qua biến môi trường MODEL_CACHE_*
+forecast_cache = ModelCache.from_env()
+
+# Thống kê cache xuất ra /metrics (đọc khi scrape)
+for _stat, _name, _kind in (("hits", "hits_total", "counter"), ("misses", "misses_total", "counter"),
+                            ("evictions", "evictions_total", "counter"),
+                            ("entries", "entries", "gauge"), ("bytes", "bytes", "gauge")):
+    REGISTRY.gauge(
+        f"expense_ai_forecast_cache_{_name}", f"Forecast cache {_stat}",
+        lambda stat=_stat: forecast_cache.stats()[stat], _kind
+    )
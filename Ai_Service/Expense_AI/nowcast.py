@@ -0,0 +1,207 @@
+"""
+Nowcast chi tiêu của tháng đang diễn ra.
+
+Dự đoán thường (predict_next_month_by_group) chỉ dùng lịch sử trước ngày 1 nên đứng yên
+cả tháng. NowcastState giữ trạng thái nhỏ cho mỗi nhóm:
+- forecast / sigma: dự đoán của tháng từ lịch sử,
+- profile: tỉ lệ chi tiêu luỹ kế theo vị trí trong tháng (31 mốc) học từ lịch sử,
+- month_to_date: số đã chi trong tháng, cộng dồn O(1) với mỗi giao dịch mới.
+project() trộn tốc độ chi thực tế với dự đoán để ước tính tổng cuối tháng và xác suất
+vượt ngân sách, không cần xử lý lại lịch sử.
+"""
+import calendar
+import math
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from categories import GROUPS, default_registry
+
+PROFILE_BINS = 31
+# Số user tối đa được giữ trạng thái trong tiến trình (LRU)
+MAX_STATES = int(os.environ.get("NOWCAST_MAX_STATES", 10000))
+
+
+class MonthlyTotalsError(ValueError):
+    """
+    Records đã bị gộp thành tổng theo tháng (mọi ngày đều là ngày 1), không học được
+    phân bố chi tiêu trong tháng.
+    """
+
+
+def check_transaction_level(dates):
+    """
+    dates: Series datetime không tz. Mọi dòng đều là 00:00 ngày 1 -> MonthlyTotalsError.
+    """
+    values = dates.to_numpy()
+    if len(values) and (values == values.astype("datetime64[M]")).all():
+        raise MonthlyTotalsError(
+            "Records look like monthly totals (every date is the 1st of a month); "
+            "nowcast needs transaction-level records"
+        )
+
+
+def month_position(day, days_in_month):
+    """
+    Vị trí của ngày trong tháng trên thang 1..31 chung cho mọi độ dài tháng
+    (ngày cuối tháng luôn là 31).
+    """
+    return np.ceil(np.asarray(day) * PROFILE_BINS / np.asarray(days_in_month)).astype(np.int64)
+
+
+def spend_profile(group_codes, positions, amounts, n_groups):
+    """
+    Ma trận (nhóm × 32): tỉ lệ chi tiêu luỹ kế đến hết mốc 0..31 trong tháng.
+    Nhóm không có lịch sử dùng phân bố đều.
+    """
+    size = n_groups * (PROFILE_BINS + 1)
+    spend = np.bincount(group_codes * (PROFILE_BINS + 1) + positions, weights=amounts, minlength=size)
+    cumulative = np.cumsum(spend.reshape(n_groups, PROFILE_BINS + 1), axis=1)
+    totals = cumulative[:, -1:]
+    uniform = np.broadcast_to(np.arange(PROFILE_BINS + 1) / PROFILE_BINS, cumulative.shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totals > 0, cumulative / totals, uniform)
+
+
+class NowcastState:
+    """
+    Trạng thái nowcast của một user cho một tháng (chỉ số tháng year * 12 + month - 1).
+    """
+
+    def __init__(self, month, forecast, sigma, profile, month_to_date, budget, registry=None):
+        self.month = month
+        self.forecast = np.asarray(forecast, dtype=float)
+        self.sigma = np.asarray(sigma, dtype=float)
+        self.profile = np.asarray(profile, dtype=float)
+        self.month_to_date = np.asarray(month_to_date, dtype=float).copy()
+        self.budget = budget
+        self.registry = registry or default_registry
+        self.transactions = 0
+        self._lock = threading.Lock()
+        self._group_index = {group: i for i, group in enumerate(GROUPS)}
+
+    def add(self, date, amount, category):
+        """
+        Cộng một giao dịch mới vào số đã chi (O(1)), xem add_many.
+        """
+        return self.add_many([{"date": date, "amount": amount, "category": category}])
+
+    def add_many(self, transactions):
+        """
+        Cộng một lô giao dịch {"date", "amount", "category"} theo kiểu tất cả hoặc không:
+        cả lô được kiểm tra trước (lỗi -> KeyError / TypeError / ValueError, chưa cộng gì)
+        rồi mới cộng vào số đã chi trong một lần.
+        Giao dịch của tháng trước bị bỏ qua; trả về False (không cộng gì) nếu có giao dịch
+        thuộc tháng sau (trạng thái đã cũ, cần dựng lại).
+        """
+        increments = np.zeros(len(GROUPS))
+        count = 0
+        for txn in transactions:
+            date = pd.Timestamp(txn['date'])
+            if date is pd.NaT:
+                raise ValueError("'date' is missing")
+            amount = float(txn['amount'])
+            if not math.isfinite(amount):
+                raise ValueError("'amount' must be a finite number")
+            month = date.year * 12 + date.month - 1
+            if month > self.month:
+                return False
+            if month == self.month:
+                increments[self._group_index[self.registry.classify(txn.get('category'))]] += amount
+                count += 1
+        with self._lock:
+            self.month_to_date += increments
+            self.transactions += count
+        return True
+
+    def project(self, today=None, budget=None):
+        """
+        Ước tính tổng cuối tháng theo nhóm và xác suất tổng chi vượt ngân sách.
+
+        Với F = tỉ lệ chi tiêu thường đã diễn ra đến hôm nay:
+        tổng ước tính = đã chi + (1 - F) * (F * tốc độ hiện tại + (1 - F) * dự đoán),
+        tốc độ hiện tại = đã chi / F. Đầu tháng nghiêng về dự đoán, cuối tháng về số thực.
+        Phần còn lại có độ lệch chuẩn (1 - F) * sigma, các nhóm coi như độc lập.
+        """
+        today = today or datetime.now()
+        if today.year * 12 + today.month - 1 != self.month:
+            raise ValueError("Nowcast state belongs to another month")
+        budget = self.budget if budget is None else budget
+
+        days_in_month = calendar.monthrange(today.year, today.month)[1]
+        elapsed = self.profile[:, int(month_position(today.day, days_in_month))]
+        remaining = 1.0 - elapsed
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pace = np.where(elapsed > 0, self.month_to_date / elapsed, self.forecast)
+        blended = elapsed * pace + remaining * self.forecast
+        projected = self.month_to_date + remaining * blended
+        remaining_std = remaining * self.sigma
+
+        total = float(projected.sum())
+        total_std = float(np.sqrt(np.sum(remaining_std ** 2)))
+        if total_std > 0:
+            overrun = 0.5 * math.erfc((budget - total) / (total_std * math.sqrt(2)))
+        else:
+            overrun = float(total > budget)
+
+        return {
+            "month": f"{self.month // 12}-{self.month % 12 + 1:02d}",
+            "day": today.day,
+            "groups": [
+                {
+                    "group": group,
+                    "forecast": round(float(self.forecast[i]), 2),
+                    "month_to_date": round(float(self.month_to_date[i]), 2),
+                    "expected_share": round(float(elapsed[i]), 4),
+                    "projected": round(float(projected[i]), 2),
+                    "confidence": round(float(1.96 * remaining_std[i]), 2),
+                }
+                for i, group in enumerate(GROUPS)
+            ],
+            "total": {
+                "month_to_date": round(float(self.month_to_date.sum()), 2),
+                "projected": round(total, 2),
+                "budget": budget,
+                "overrun_probability": round(overrun, 4),
+            },
+        }
+
+
+# -----------------------------------
+# 🗃️ Trạng thái theo user (trong tiến trình, LRU tối đa MAX_STATES user)
+# -----------------------------------
+_states = OrderedDict()
+_states_lock = threading.Lock()
+
+
+def remember(user, state):
+    with _states_lock:
+        _states[str(user)] = state
+        _states.move_to_end(str(user))
+        while len(_states) > MAX_STATES:
+            _states.popitem(last=False)
+
+
+def get_state(user):
+    """
+    Trạng thái của user; trạng thái của tháng đã qua bị bỏ luôn (cần gọi /nowcast lại).
+    """
+    today = datetime.now()
+    with _states_lock:
+        state = _states.get(str(user))
+        if state is None:
+            return None
+        if state.month < today.year * 12 + today.month - 1:
+            del _states[str(user)]
+            return None
+        _states.move_to_end(str(user))
+        return state
+
+
+def forget(user):
+    with _states_lock:
+        _states.pop(str(user), None)
@@ -0,0 +1,99 @@
+"""
+Trạng thái dự đoán online (engine "online") của các user trong kho tổng theo tháng.
+
+Mỗi (user, nhóm) giữ một OnlineForecaster (forecasters.py), lưu trong bảng online_states
+kèm phiên bản dữ liệu của user:
+- /ingest chỉ thêm giao dịch mới -> cộng O(1) từng giao dịch vào trạng thái đã lưu.
+- Giao dịch bị sửa / xoá hoặc thêm vào tháng đã đóng -> trạng thái cũ, được dựng lại
+  từ bảng tổng theo tháng (O(số tháng), không phụ thuộc số giao dịch) ở lần đọc sau.
+/predict với engine "online" và chỉ 'userId' đọc thẳng trạng thái, không huấn luyện lại.
+"""
+from datetime import datetime
+
+from aggregate_store import get_store
+from categories import default_registry
+from forecasters import OnlineForecaster
+from metrics import REGISTRY
+
+STATE_UPDATES = REGISTRY.counter(
+    "expense_ai_online_state_updates_total",
+    "Online forecaster state updates (incremental transactions or full rebuilds)", ("kind",)
+)
+
+
+def current_month():
+    today = datetime.now()
+    return today.year * 12 + today.month - 1
+
+
+def build_states(monthly, month=None, registry=None):
+    """
+    {nhóm: OnlineForecaster} từ bảng tổng theo tháng của một user (cột month, category, amount).
+    Các tháng trước `month` được đóng, tháng `month` trở đi nằm trong tháng đang mở.
+    """
+    registry = registry or default_registry
+    month = current_month() if month is None else month
+    groups = registry.classify_series(monthly["category"])
+    totals = monthly["amount"].groupby([groups, monthly["month"]], observed=True).sum()
+
+    states = {}
+    for (group, total_month), amount in totals.items():
+        state = states.setdefault(group, OnlineForecaster())
+        if total_month < month:
+            state.observe(int(total_month), float(amount))
+        else:
+            state.add(int(total_month), float(amount))
+    return states
+
+
+def encode_states(states):
+    return {group: state.to_dict() for group, state in states.items()}
+
+
+def decode_states(payload):
+    return {group: OnlineForecaster.from_dict(state) for group, state in payload.items()}
+
+
+def user_states(user, store=None):
+    """
+    Trạng thái của user đúng với phiên bản dữ liệu hiện tại: đọc từ kho, hoặc dựng lại
+    từ bảng tổng theo tháng và lưu lại nếu chưa có / đã cũ.
+    """
+    store = store or get_store()
+    version = store.version(user)
+    saved = store.load_online_states(user)
+    if saved is not None and saved[0] == version:
+        return decode_states(saved[1])
+
+    states = build_states(store.monthly_frame([user]))
+    store.save_online_states(user, version, encode_states(states))
+    STATE_UPDATES.inc(1, "rebuild")
+    return states
+
+
+def apply_journal(journal, store=None, registry=None):
+    """
+    Cộng các giao dịch mới của một lần AggregateStore.apply(events, journal) vào trạng thái
+    đã lưu (O(1) mỗi giao dịch). User không cập nhật được sẽ được dựng lại khi đọc.
+    """
+    store = store or get_store()
+    registry = registry or default_registry
+    by_user = {}
+    for entry in journal:
+        by_user.setdefault(entry[0], []).append(entry)
+
+    for user, entries in by_user.items():
+        if any(month is None for _, month, _, _ in entries):
+            continue
+        saved = store.load_online_states(user)
+        version = store.version(user)
+        # Chỉ khi trạng thái đúng với dữ liệu ngay trước lần apply này
+        if saved is None or saved[0] != version - 1:
+            continue
+        states = decode_states(saved[1])
+        if all(
+            states.setdefault(registry.classify(category), OnlineForecaster()).add(month, amount)
+            for _, month, category, amount in entries
+        ):
+            store.save_online_states(user, version, encode_states(states))
+            STATE_UPDATES.inc(len(entries), "incremental")
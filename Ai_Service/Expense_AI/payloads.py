@@ -0,0 +1,248 @@
+import io
+import json
+import math
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from streaming import fold_ndjson
+
+# pyarrow / msgpack là phụ thuộc tuỳ chọn: chỉ cần khi client dùng định dạng nhị phân
+# (pip install pyarrow msgpack). Thiếu thư viện -> 415 Unsupported Media Type.
+# orjson cũng tuỳ chọn: chỉ giúp mã hoá JSON nhanh hơn, thiếu thì dùng json chuẩn.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON = "application/json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/msgpack"
+MSGPACK_ALIASES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+NDJSON = "application/x-ndjson"
+NDJSON_ALIASES = (NDJSON, "application/ndjson", "application/jsonl", "application/x-jsonlines")
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+class InvalidPayload(Exception):
+    pass
+
+
+def _mimetype(content_type):
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        raise UnsupportedFormat(f"{ARROW_STREAM} requires the 'pyarrow' package")
+    return pa
+
+
+def _import_msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise UnsupportedFormat(f"{MSGPACK} requires the 'msgpack' package")
+    return msgpack
+
+
+def _query_params(args):
+    """
+    Tham số vô hướng truyền qua query string (?budget=2000&engine=linear) cho body Arrow / NDJSON.
+    """
+    params = {}
+    for key, value in args.items():
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+# -----------------------------------
+# 📥 Đọc body request
+# -----------------------------------
+def is_ndjson(content_type):
+    return _mimetype(content_type) in NDJSON_ALIASES
+
+
+def decode_ndjson(stream, args=None, allow_folded=True):
+    """
+    Body NDJSON (mỗi dòng một record) đọc dần từ stream, gộp thành tổng theo tháng
+    nên bộ nhớ không tăng theo độ dài lịch sử. Các tham số khác lấy từ query string.
+    allow_folded=False: endpoint cần records từng giao dịch -> InvalidPayload.
+    """
+    if not allow_folded:
+        raise InvalidPayload(
+            f"{NDJSON} bodies are folded into monthly totals; this endpoint needs transaction-level "
+            "records (send JSON, MessagePack or Arrow)"
+        )
+    try:
+        records = fold_ndjson(stream)
+    except Exception as e:
+        raise InvalidPayload(f"Cannot decode {NDJSON} body: {e}")
+    data = _query_params(args or {})
+    data["records"] = records
+    return data
+
+
+def decode_body(body, content_type, args=None, allow_folded=True):
+    """
+    Giải mã body theo Content-Type, trả về dict tham số giống JSON.
+    - JSON: {"records": [{...}, ...] hoặc {"date": [...], "amount": [...], "category": [...]}, ...}
+    - MessagePack: cùng cấu trúc, records nên ở dạng cột (date/amount/category là mảng).
+    - Arrow IPC stream: body là bảng records, các tham số khác lấy từ query string.
+    - NDJSON: mỗi dòng một record, tham số lấy từ query string (xem decode_ndjson);
+      chỉ nhận khi allow_folded (endpoint dùng tổng theo tháng).
+    'records' dạng cột được chuyển thành DataFrame bằng một lần chuyển đổi.
+    """
+    mimetype = _mimetype(content_type)
+    if mimetype in NDJSON_ALIASES:
+        return decode_ndjson(io.BytesIO(body), args, allow_folded)
+    try:
+        if mimetype == ARROW_STREAM:
+            pa = _import_pyarrow()
+            with pa.ipc.open_stream(body) as reader:
+                table = reader.read_all()
+            data = _query_params(args or {})
+            data["records"] = table.to_pandas(date_as_object=False)
+            return data
+
+        if mimetype in MSGPACK_ALIASES:
+            msgpack = _import_msgpack()
+            data = msgpack.unpackb(body, raw=False)
+        elif mimetype in ("", JSON) or mimetype.endswith("+json"):
+            data = json.loads(body) if body else None
+        else:
+            raise UnsupportedFormat(f"Unsupported Content-Type '{mimetype}'")
+    except (UnsupportedFormat, InvalidPayload):
+        raise
+    except Exception as e:
+        raise InvalidPayload(f"Cannot decode {mimetype or JSON} body: {e}")
+
+    if not isinstance(data, dict):
+        raise InvalidPayload("Request body must be an object")
+    if isinstance(data.get("records"), dict):
+        data["records"] = pd.DataFrame(data["records"])
+    return data
+
+
+# -----------------------------------
+# 📤 Ghi response
+# -----------------------------------
+def negotiate(accept):
+    """
+    Chọn định dạng response từ header Accept (mặc định JSON).
+    """
+    for part in (accept or "").split(","):
+        mimetype = _mimetype(part)
+        if mimetype == ARROW_STREAM:
+            return ARROW_STREAM
+        if mimetype in MSGPACK_ALIASES:
+            return MSGPACK
+        if mimetype in (JSON, "*/*"):
+            return JSON
+    return JSON
+
+
+def dataframe_to_arrow(df):
+    pa = _import_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def dataframe_from_arrow(body):
+    pa = _import_pyarrow()
+    with pa.ipc.open_stream(body) as reader:
+        return reader.read_all().to_pandas(date_as_object=False)
+
+
+def packb(obj):
+    return _import_msgpack().packb(obj, use_bin_type=True, default=to_builtin)
+
+
+def frame_records(df):
+    """
+    Tương đương df.to_dict(orient="records") nhưng đọc theo cột (mỗi cột một lần tolist),
+    nhanh hơn nhiều lần với bảng lớn.
+    """
+    columns = [str(column) for column in df.columns]
+    rows = zip(*(df[column].tolist() for column in df.columns))
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def to_builtin(obj):
+    """
+    Hook `default` cho bộ mã hoá JSON / MessagePack: chỉ được gọi với kiểu bộ mã hoá
+    không tự xử lý được (scalar / mảng NumPy, DataFrame, Timestamp), không duyệt lại cả cây.
+    """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, pd.DataFrame):
+        return frame_records(obj)
+    if isinstance(obj, pd.Series):
+        return obj.tolist()
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, (pd.Timestamp, datetime)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _finite_or_none(obj):
+    """
+    Thay NaN / ±inf bằng None trong cả cây (như orjson), chuyển kiểu NumPy / pandas qua to_builtin.
+    """
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite_or_none(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite_or_none(value) for value in obj]
+    if isinstance(obj, (np.generic, np.ndarray, pd.DataFrame, pd.Series)):
+        return _finite_or_none(to_builtin(obj))
+    return obj
+
+
+def dumps_json(obj):
+    """
+    Mã hoá JSON (bytes, UTF-8) trong một lượt. Dùng orjson nếu có (scalar / mảng NumPy được
+    mã hoá trực tiếp trong C, NaN -> null), ngược lại dùng json của thư viện chuẩn với cùng
+    kết quả: NaN / inf cũng thành null (chỉ duyệt lại cả cây khi thực sự có giá trị đó).
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            obj, default=to_builtin, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    try:
+        text = json.dumps(obj, default=to_builtin, ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+    except ValueError:
+        text = json.dumps(
+            _finite_or_none(obj), default=to_builtin, ensure_ascii=False, separators=(",", ":"), allow_nan=False
+        )
+    return text.encode()
+
+
+def encode_response(result, accept):
+    """
+    Mã hoá kết quả theo header Accept, trả về (body bytes, mimetype).
+    Arrow chỉ áp dụng cho kết quả dạng bảng (DataFrame); còn lại dùng MessagePack hoặc JSON.
+    """
+    mimetype = negotiate(accept)
+    if mimetype == ARROW_STREAM and isinstance(result, pd.DataFrame):
+        return dataframe_to_arrow(result), ARROW_STREAM
+    if mimetype in (ARROW_STREAM, MSGPACK):
+        return packb(result), MSGPACK
+    return dumps_json(result), JSON
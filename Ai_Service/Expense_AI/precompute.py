@@ -0,0 +1,269 @@
+"""
+Tính trước kết quả /insights (đánh giá tháng trước, dự đoán tháng này, đề xuất cắt giảm)
+cho các user đang hoạt động, lưu vào kho tổng theo tháng (aggregate_store.py) để handler
+chỉ cần đọc ra. Một worker thread nền điều phối hàng đợi; việc tính (huấn luyện forest)
+chạy trong một tiến trình con riêng để không tranh GIL với tiến trình phục vụ request
+(Flask hoặc event loop của asgi.py).
+
+- Sau /ingest: các user bị thay đổi được đưa vào hàng đợi; kết quả cũ mất hiệu lực
+  ngay vì phiên bản dữ liệu của user tăng.
+- Khi sang tháng mới (kiểm tra mỗi PRECOMPUTE_TICK_SECONDS) và khi worker khởi động:
+  mọi user đã đăng ký chưa có kết quả hợp lệ được đưa vào hàng đợi. Worker khởi động cùng
+  service (start_precomputer trong app.py / lifespan của asgi.py), không chờ /ingest đầu tiên.
+- POST /precompute đăng ký user cùng budget / income dùng cho phần đánh giá và đề xuất.
+
+Cấu hình: PRECOMPUTE_ENABLED (mặc định 1), PRECOMPUTE_ENGINE (mặc định forest),
+PRECOMPUTE_TICK_SECONDS (mặc định 60), PRECOMPUTE_PROCESS (mặc định 1; 0 -> tính ngay trong
+worker thread), PRECOMPUTE_START_METHOD (mặc định forkserver).
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from aggregate_store import AggregateStore, get_store
+from expenses_model import generate_insights
+from metrics import REGISTRY
+from payloads import dumps_json
+
+DEFAULT_BUDGET = 2000
+DEFAULT_INCOME = 3000
+
+JOBS = REGISTRY.counter(
+    "expense_ai_precompute_jobs_total", "Precompute jobs by trigger and outcome", ("reason", "status")
+)
+LAG = REGISTRY.histogram(
+    "expense_ai_precompute_lag_seconds", "Time from enqueue until the precomputed result is stored"
+)
+READS = REGISTRY.counter(
+    "expense_ai_precompute_reads_total", "Handler lookups of precomputed results", ("result",)
+)
+
+
+def current_month():
+    today = datetime.now()
+    return today.year * 12 + today.month - 1
+
+
+def compute_user(store, user, engine):
+    """
+    Tính và lưu kết quả cho một user. Phiên bản được đọc TRƯỚC dữ liệu, nên nếu có
+    ingest xen giữa thì kết quả lưu lại đã cũ và user đã được xếp hàng tính lại.
+    """
+    version = store.version(user)
+    budget, income = store.precompute_users().get(user, (DEFAULT_BUDGET, DEFAULT_INCOME))
+    df = store.records_frame([user]).drop(columns=["userId"])
+    insights = generate_insights(df, budget, income, engine=engine)
+    payload = {"engine": engine, "budget": budget, "income": income, "insights": insights}
+    store.save_precomputed(user, current_month(), version, dumps_json(payload))
+
+
+# -----------------------------------
+# 🧵 Tiến trình con tính trước
+# -----------------------------------
+_process_stores = {}
+
+
+def _process_init():
+    warnings.filterwarnings("ignore")
+
+
+def _compute_in_process(store_path, user, engine):
+    """
+    Chạy trong tiến trình con: mở kho một lần cho mỗi đường dẫn (SQLite WAL cho phép
+    đọc / ghi cùng lúc với tiến trình chính); số liệu metrics được gửi về tiến trình chính.
+    """
+    store = _process_stores.get(store_path)
+    if store is None:
+        store = _process_stores[store_path] = AggregateStore(store_path)
+    compute_user(store, user, engine)
+    return REGISTRY.drain()
+
+
+def _new_process_pool():
+    context = multiprocessing.get_context(os.environ.get("PRECOMPUTE_START_METHOD", "forkserver"))
+    return ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_process_init)
+
+
+class Precomputer:
+    """
+    Hàng đợi user cần tính lại (không trùng lặp) và một worker thread xử lý tuần tự.
+    use_process: tính trong tiến trình con (không dùng được với kho ':memory:').
+    """
+
+    def __init__(self, store, engine="forest", tick_seconds=60, use_process=True):
+        self.store = store
+        self.engine = engine
+        self.tick_seconds = tick_seconds
+        self.use_process = use_process and store.path != ":memory:"
+        self._pool = None
+        self._queue = queue.Queue()
+        self._pending = {}  # user -> (thời điểm vào hàng đợi, lý do)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._month = None
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="precompute", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def enqueue(self, users, reason):
+        self.start()
+        now = time.monotonic()
+        with self._lock:
+            for user in users:
+                if user not in self._pending:
+                    self._pending[user] = (now, reason)
+                    self._queue.put(user)
+
+    def stats(self):
+        return {
+            "running": self._thread is not None,
+            "queue_depth": self.queue_depth,
+            "engine": self.engine,
+            "process": self.use_process,
+        }
+
+    # -----------------------------------
+    # 🔁 Worker
+    # -----------------------------------
+    def _run(self):
+        self._check_month()
+        while True:
+            try:
+                user = self._queue.get(timeout=self.tick_seconds)
+            except queue.Empty:
+                self._check_month()
+                continue
+            if user is None:
+                return
+
+            with self._lock:
+                enqueued_at, reason = self._pending.pop(user)
+            try:
+                self.compute(user)
+                status = "ok"
+            except Exception:
+                status = "error"
+            JOBS.inc(1, reason, status)
+            LAG.observe(time.monotonic() - enqueued_at)
+
+    def _check_month(self):
+        month = current_month()
+        if month != self._month:
+            reason = "startup" if self._month is None else "month_rollover"
+            self._month = month
+            self.enqueue(self.store.stale_precompute_users(month), reason)
+
+    def compute(self, user):
+        """
+        Tính một user (xem compute_user), trong tiến trình con nếu use_process.
+        Worker thread chỉ chờ kết quả nên không giữ GIL trong lúc huấn luyện.
+        """
+        if not self.use_process:
+            compute_user(self.store, user, self.engine)
+            return
+        if self._pool is None:
+            self._pool = _new_process_pool()
+        try:
+            worker_metrics = self._pool.submit(_compute_in_process, self.store.path, user, self.engine).result()
+        except BrokenProcessPool:
+            # Tiến trình con chết (ví dụ hết bộ nhớ) -> tạo pool mới cho job sau
+            self._pool = None
+            raise
+        REGISTRY.merge(worker_metrics)
+
+
+_precomputer = None
+_precomputer_lock = threading.Lock()
+
+
+def enabled():
+    return os.environ.get("PRECOMPUTE_ENABLED", "1") != "0"
+
+
+def get_precomputer():
+    """
+    Scheduler dùng chung của tiến trình (None nếu PRECOMPUTE_ENABLED=0).
+    """
+    global _precomputer
+    if not enabled():
+        return None
+    if _precomputer is None:
+        with _precomputer_lock:
+            if _precomputer is None:
+                _precomputer = Precomputer(
+                    get_store(),
+                    engine=os.environ.get("PRECOMPUTE_ENGINE", "forest"),
+                    tick_seconds=float(os.environ.get("PRECOMPUTE_TICK_SECONDS", 60)),
+                    use_process=os.environ.get("PRECOMPUTE_PROCESS", "1") != "0",
+                )
+    return _precomputer
+
+
+def start_precomputer():
+    """
+    Chạy worker ngay khi service khởi động, để việc tính lại lúc khởi động và khi sang
+    tháng mới không phụ thuộc vào việc có /ingest hay không.
+    """
+    precomputer = get_precomputer()
+    if precomputer is not None:
+        precomputer.start()
+    return precomputer
+
+
+def stop_precomputer():
+    """
+    Dừng worker và tiến trình con tính trước (khi service tắt).
+    """
+    if _precomputer is not None:
+        _precomputer.stop()
+
+
+def lookup(user, engine, budget=None, income=None):
+    """
+    Kết quả /insights tính trước của user nếu còn hợp lệ, cùng tham số và không phải lỗi,
+    ngược lại None (handler tự tính). Đọc thẳng từ kho nên dùng được cả trong worker process của asgi.py.
+    """
+    if not enabled():
+        return None
+    payload = get_store().load_precomputed(user, current_month())
+    if (
+        payload is None
+        or "error" in payload["insights"]
+        or payload["engine"] != engine
+        or (budget is not None and payload["budget"] != budget)
+        or (income is not None and payload["income"] != income)
+    ):
+        READS.inc(1, "miss")
+        return None
+    READS.inc(1, "hit")
+    return payload["insights"]
+
+
+REGISTRY.gauge(
+    "expense_ai_precompute_queue_depth", "Users waiting to be precomputed",
+    lambda: _precomputer.queue_depth if _precomputer is not None else 0
+)
@@ -0,0 +1,40 @@
+"""
+Import trước các thư viện nặng (sklearn, scipy) trong thread nền, sau khi service đã
+sẵn sàng nhận request. Health check không phải chờ; request /predict đầu tiên
+cũng không phải trả giá import nếu prewarm đã xong.
+
+Tắt bằng PREWARM=0 (ví dụ khi chạy script / benchmark đo thời gian import).
+"""
+import importlib
+import os
+import threading
+
+HEAVY_MODULES = ("sklearn.ensemble", "scipy.optimize")
+
+_started = False
+_lock = threading.Lock()
+
+
+def warm_imports():
+    """
+    Import tuần tự các module nặng; thư viện tuỳ chọn không cài thì bỏ qua.
+    """
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def start_prewarm():
+    """
+    Chạy warm_imports trong thread daemon (chỉ một lần cho mỗi tiến trình).
+    """
+    global _started
+    if os.environ.get("PREWARM", "1") == "0":
+        return
+    with _lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=warm_imports, name="prewarm", daemon=True).start()
@@ -0,0 +1,126 @@
+"""
+Profile một request riêng lẻ theo yêu cầu của admin.
+
+Bật bằng header `X-Profile: pstats | collapsed` (hoặc query `?profile=...`) kèm
+`X-Profile-Token` trùng với biến môi trường PROFILE_ADMIN_TOKEN (không đặt -> tắt hẳn).
+- pstats: cProfile (tất định), file đọc được bằng `python -m pstats` / snakeviz.
+- collapsed: lấy mẫu stack theo chu kỳ PROFILE_SAMPLE_INTERVAL giây (mặc định 0.005),
+  định dạng "a;b;c <số mẫu>" cho flamegraph.pl / speedscope.
+Kết quả ghi vào PROFILE_DIR (mặc định ./profiles), tải về qua GET /profiles/<id>.
+Khi không có header/query thì chỉ tốn một lần tra header, không bọc gì thêm.
+"""
+import cProfile
+import hmac
+import marshal
+import os
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime
+
+MODES = {"pstats": "prof", "collapsed": "collapsed"}
+PROFILE_ID = re.compile(r"^[\w.-]+\.(prof|collapsed)$")
+
+
+class ProfilingDenied(Exception):
+    pass
+
+
+def _token_ok(token):
+    expected = os.environ.get("PROFILE_ADMIN_TOKEN")
+    return bool(expected) and hmac.compare_digest((token or "").encode(), expected.encode())
+
+
+def requested_mode(headers, args):
+    """
+    Chế độ profile được yêu cầu (None nếu request không yêu cầu).
+    headers: mapping không phân biệt hoa thường hoặc dict với khoá viết thường.
+    """
+    mode = headers.get("x-profile") or args.get("profile")
+    if not mode:
+        return None
+    if not _token_ok(headers.get("x-profile-token")):
+        raise ProfilingDenied("Profiling requires a valid X-Profile-Token")
+    if mode not in MODES:
+        raise ProfilingDenied(f"Invalid profile mode '{mode}', expected one of {list(MODES)}")
+    return mode
+
+
+def profile_dir():
+    return os.environ.get("PROFILE_DIR", "profiles")
+
+
+# -----------------------------------
+# 🔬 Profiler
+# -----------------------------------
+class StackSampler:
+    """
+    Lấy mẫu stack Python của một thread từ một thread nền (profiler thống kê).
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_call(fn, args, mode, label):
+    """
+    Chạy fn(*args) dưới profiler, lưu kết quả và trả về (giá trị của fn, profile id).
+    """
+    if mode == "pstats":
+        profiler = cProfile.Profile()
+        value = profiler.runcall(fn, *args)
+        profiler.create_stats()
+        content = marshal.dumps(profiler.stats)
+    else:
+        interval = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.005))
+        with StackSampler(threading.get_ident(), interval) as sampler:
+            value = fn(*args)
+        content = sampler.collapsed().encode()
+
+    slug = re.sub(r"[^\w]+", "-", label).strip("-") or "root"
+    profile_id = f"{datetime.now():%Y%m%d-%H%M%S}-{slug}-{uuid.uuid4().hex[:8]}.{MODES[mode]}"
+    os.makedirs(profile_dir(), exist_ok=True)
+    with open(os.path.join(profile_dir(), profile_id), "wb") as f:
+        f.write(content)
+    return value, profile_id
+
+
+def profile_path(profile_id, token):
+    """
+    Đường dẫn file profile đã lưu (kiểm tra token và tên file).
+    """
+    if not _token_ok(token):
+        raise ProfilingDenied("Profiling requires a valid X-Profile-Token")
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(profile_dir(), profile_id)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,100 @@
+"""
+Gộp các request tính toán giống hệt nhau đang chạy đồng thời (single-flight).
+
+Dashboard gửi cùng một payload /predict mỗi lần tải trang; nhiều tab hoặc refresh liên tục
+tạo ra các request trùng nhau cùng lúc. Request đầu tiên với một khoá (digest của path,
+Content-Type, query string và body thô) chạy tính toán; các request trùng đến khi nó đang
+chạy chỉ chờ và nhận chung kết quả (kể cả lỗi). Không cache gì sau khi tính xong.
+
+SINGLE_FLIGHT=0 để tắt.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+
+from metrics import REGISTRY
+
+COALESCED = REGISTRY.counter(
+    "expense_ai_coalesced_requests_total",
+    "Requests served by waiting on an identical in-flight computation", ("endpoint",)
+)
+
+
+def enabled():
+    return os.environ.get("SINGLE_FLIGHT", "1") != "0"
+
+
+def request_key(path, content_type, args, body):
+    """
+    Digest của request; body được băm nguyên dạng, không cần giải mã.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (path, (content_type or "").split(";")[0].strip().lower(), repr(sorted(args.items()))):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Bản dùng thread (Flask / WSGI).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, endpoint=""):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED.inc(1, endpoint)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+
+class AsyncSingleFlight:
+    """
+    Bản dùng asyncio (asgi.py). Phép tính chạy trong một task riêng nên client đầu tiên
+    ngắt kết nối không huỷ kết quả của các request đang chờ.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, factory, endpoint=""):
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            COALESCED.inc(1, endpoint)
+        return await asyncio.shield(task)
@@ -0,0 +1,107 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregate_store import month_dates
+
+# Số dòng NDJSON được parse mỗi lần; bộ nhớ chỉ phụ thuộc vào giá trị này
+# và số (user, tháng, category) khác nhau, không phụ thuộc độ dài lịch sử.
+DEFAULT_CHUNK_ROWS = int(os.environ.get("NDJSON_CHUNK_ROWS", 50_000))
+# Gộp các phần tổng đã tích luỹ sau mỗi ngần này chunk
+COMPACT_EVERY = 8
+
+
+# -----------------------------------
+# 🌊 Gộp records NDJSON thành tổng theo tháng
+# -----------------------------------
+class MonthlyAccumulator:
+    """
+    Cộng dồn từng chunk records vào tổng theo (userId, tháng, category).
+    Kết quả giống hệt records gốc với evaluate / predict vì các hàm đó chỉ dùng
+    tổng theo category trong tháng.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self.rows = 0
+
+    def add(self, rows):
+        """
+        rows: list các dict {"date", "amount", "category", ["userId"]}.
+        """
+        n = len(rows)
+        if n == 0:
+            return
+        # Như đường JSON: amount thiếu / không phải số -> NaN (bị bỏ qua khi cộng),
+        # record không có ngày hợp lệ không thuộc tháng nào -> bỏ
+        amounts = pd.to_numeric(pd.Series([row.get("amount") for row in rows]), errors="coerce").to_numpy(dtype=float)
+        dates = pd.to_datetime(pd.Series([row.get("date") for row in rows]))
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        known = dates.notna().to_numpy()
+        months = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy()[known].astype(np.int64)
+
+        categories = np.empty(n, dtype=object)
+        users = np.empty(n, dtype=object)
+        for i, row in enumerate(rows):
+            categories[i] = row.get("category")
+            users[i] = row.get("userId")
+        self.rows += n
+        if not known.any():
+            return
+        if not known.all():
+            amounts, categories, users = amounts[known], categories[known], users[known]
+
+        part = pd.Series(amounts).groupby([users, months, categories], dropna=False).sum()
+        self._parts.append(part)
+        if len(self._parts) >= COMPACT_EVERY:
+            self._compact()
+
+    def _compact(self):
+        if len(self._parts) > 1:
+            combined = pd.concat(self._parts)
+            self._parts = [combined.groupby(level=[0, 1, 2], dropna=False).sum()]
+
+    def records_frame(self):
+        """
+        Bảng records (date = ngày 1 của tháng, amount = tổng, category[, userId]).
+        Cột userId chỉ có khi records gửi kèm userId.
+        """
+        self._compact()
+        if not self._parts:
+            return pd.DataFrame(columns=["date", "amount", "category"])
+        totals = self._parts[0]
+        users = totals.index.get_level_values(0)
+        frame = pd.DataFrame({
+            "date": month_dates(totals.index.get_level_values(1)),
+            "amount": totals.to_numpy(),
+            "category": totals.index.get_level_values(2).to_numpy(dtype=object),
+        })
+        if users.notna().any():
+            frame["userId"] = users.to_numpy(dtype=object)
+        return frame
+
+
+def fold_ndjson(stream, chunk_rows=None):
+    """
+    Đọc stream NDJSON (mỗi dòng một record) theo từng chunk cố định và gộp vào
+    tổng theo tháng. Trả về DataFrame records (xem MonthlyAccumulator.records_frame).
+    """
+    chunk_rows = chunk_rows or DEFAULT_CHUNK_ROWS
+    accumulator = MonthlyAccumulator()
+    chunk = []
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            chunk.append(json.loads(line))
+        except ValueError as e:
+            raise ValueError(f"line {line_no}: {e}")
+        if len(chunk) >= chunk_rows:
+            accumulator.add(chunk)
+            chunk = []
+    accumulator.add(chunk)
+    return accumulator.records_frame()
@@ -23,6 +23,16 @@ exports.predictExpensesAi = async (req, res) => {
     }
 };
 
+// Dự đoán chi tiêu tháng hiện tại cho nhiều người dùng (records có userId)
+exports.predictBatchExpensesAi = async (req, res) => {
+    try {
+        const response = await axios.post(`${AI_SERVICE_URL}/predict/batch`, req.body);
+        res.status(200).json(response.data);
+    } catch (error) {
+        res.status(500).json({ message: "Error predicting expenses in batch", error: error.message });
+    }
+};
+
 // Đề xuất kế hoạch chi tiêu tháng tới
 exports.suggestExpenseAi = async (req, res) => {
     try {
@@ -31,4 +41,24 @@ exports.suggestExpenseAi = async (req, res) => {
     } catch (error) {
         res.status(500).json({ message: "Error suggesting expenses", error: error.message });
     };
-};
\ No newline at end of file
+};
+
+// Đánh giá + dự đoán + đề xuất trong một lần gọi
+exports.insightsExpensesAi = async (req, res) => {
+    try {
+        const response = await axios.post(`${AI_SERVICE_URL}/insights`, req.body);
+        res.status(200).json(response.data);
+    } catch (error) {
+        res.status(500).json({ message: "Error generating expense insights", error: error.message });
+    }
+};
+
+// Giao dịch / tháng chi tiêu bất thường
+exports.anomaliesExpensesAi = async (req, res) => {
+    try {
+        const response = await axios.post(`${AI_SERVICE_URL}/anomalies`, req.body);
+        res.status(200).json(response.data);
+    } catch (error) {
+        res.status(500).json({ message: "Error detecting expense anomalies", error: error.message });
+    }
+};
@@ -3,11 +3,17 @@ const router = express.Router();
 const {
   evaluateExpensesAi,
   predictExpensesAi,
+  predictBatchExpensesAi,
   suggestExpenseAi,
+  insightsExpensesAi,
+  anomaliesExpensesAi,
 } = require("../controllers/aiController");
 
 router.post("/evaluate", evaluateExpensesAi);
 router.post("/predict", predictExpensesAi);
+router.post("/predict/batch", predictBatchExpensesAi);
 router.post("/suggest", suggestExpenseAi);
+router.post("/insights", insightsExpensesAi);
+router.post("/anomalies", anomaliesExpensesAi);
 
 module.exports = router;